@@ -1,16 +1,114 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, Response, stream_with_context, send_file
+from flask import before_render_template, template_rendered, make_response, g
+from markupsafe import Markup
 from functools import wraps
+from datetime import datetime, timedelta
+import os
 import user_service
 import auth_service
+import bulk_io
+import metrics
+import profiling
+from cache import TTLCache
 
 app = Flask(__name__)
 app.secret_key = 'your_secret_key_here_change_in_production'
 
+# Hand each request's pooled database connection back when the request ends
+app.teardown_appcontext(user_service.release_db)
+
+# GROUP_COMMIT=1 sells concurrent checkouts in shared transactions (see user_service.start_group_commit)
+if os.environ.get('GROUP_COMMIT') == '1':
+    user_service.start_group_commit()
+
+# Per-request query, SQL, hashing, template and total timings (see metrics.py)
+@app.before_request
+def start_request_metrics():
+    metrics.start_request()
+
+@app.after_request
+def finish_request_metrics(response):
+    metrics.finish_request(request.endpoint, response.status_code)
+    return response
+
+@before_render_template.connect_via(app)
+def start_template_metrics(sender, **extra):
+    metrics.start_template()
+
+@template_rendered.connect_via(app)
+def finish_template_metrics(sender, **extra):
+    metrics.finish_template()
+
+# Drop cached rows that other worker processes have changed since the last request
+@app.before_request
+def sync_worker_caches():
+    # Static files never read the caches
+    if request.endpoint != 'static':
+        user_service.sync_caches()
+
+# Transaction history paging
+SALES_PAGE_SIZE = 50
+MAX_SALES_PAGE_SIZE = 200
+
+# User administration paging
+USERS_PAGE_SIZE = 50
+MAX_USERS_PAGE_SIZE = 200
+
+# Product search results, and how many products the purchase page lists before searching
+PRODUCT_SEARCH_LIMIT = 20
+MAX_PRODUCT_SEARCH_LIMIT = 100
+PURCHASE_PAGE_LIMIT = 100
+
+# Bulk product files: exported columns, and how many row errors an import shows
+PRODUCT_EXPORT_FIELDS = ('id', 'name', 'sku', 'quantity', 'price')
+MAX_IMPORT_ERRORS_SHOWN = 100
+
+# Transaction export columns
+SALE_EXPORT_FIELDS = ('id', 'timestamp', 'customer_name', 'customer_email', 'total', 'created_by')
+SALE_ITEM_EXPORT_FIELDS = ('sale_id', 'timestamp', 'product_id', 'sku', 'product_name', 'quantity', 'price', 'line_total')
+
+# Default /admin/reports range in days
+REPORT_DAYS = 30
+
+# Seconds clients are asked to wait when the password hashing queue is full
+HASH_RETRY_AFTER = 2
+
+# Rendered receipts, keyed by (template, sale id). Sales never change after checkout;
+# an entry is re-rendered only when product names may have changed since.
+RECEIPT_CACHE_SIZE = 2000
+RECEIPT_TTL = 3600
+
+_receipts = TTLCache(RECEIPT_TTL, RECEIPT_CACHE_SIZE)
+
+# Endpoints the profiler never wraps (its own pages and static files), and the report orderings
+PROFILER_EXCLUDED_ENDPOINTS = {'static', 'admin_profiling', 'admin_profile_report', 'admin_profile_download'}
+PROFILE_SORT_KEYS = ('cumulative', 'tottime', 'calls')
+
+def current_user():
+    """
+    The logged-in user as (id, first_name, last_name, email, role), looked up through the
+    principal cache once per request so that role changes and deleted accounts apply to
+    sessions that are already open. Returns None, ending the session, if the user is gone.
+    """
+    if 'principal' not in g:
+        principal = None
+        if 'user_id' in session:
+            principal = user_service.get_principal(session['user_id'])
+            if principal is None:
+                session.clear()
+            else:
+                # Keep the copies in the session (used by templates) current
+                for key, value in zip(('first_name', 'last_name', 'email', 'role'), principal[1:]):
+                    if session.get(key) != value:
+                        session[key] = value
+        g.principal = principal
+    return g.principal
+
 # Decorators for role-based access control
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
+        if current_user() is None:
             return redirect(url_for('login'))
         return f(*args, **kwargs)
     return decorated_function
@@ -18,7 +116,8 @@ def login_required(f):
 def admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'user_id' not in session or session.get('role') != 'admin':
+        user = current_user()
+        if user is None or user[4] != 'admin':
             flash('Access denied. Admin privileges required.', 'danger')
             return redirect(url_for('dashboard'))
         return f(*args, **kwargs)
@@ -27,7 +126,8 @@ def admin_required(f):
 def seller_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'user_id' not in session or session.get('role') not in ['admin', 'seller']:
+        user = current_user()
+        if user is None or user[4] not in ['admin', 'seller']:
             flash('Access denied. Seller privileges required.', 'danger')
             return redirect(url_for('dashboard'))
         return f(*args, **kwargs)
@@ -36,12 +136,89 @@ def seller_required(f):
 def customer_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'user_id' not in session or session.get('role') != 'customer':
+        user = current_user()
+        if user is None or user[4] != 'customer':
             flash('Access denied. Customer privileges required.', 'danger')
             return redirect(url_for('dashboard'))
         return f(*args, **kwargs)
     return decorated_function
 
+def sales_filters_from_request():
+    """Transaction history filters (dates and customer email) from the query string"""
+    filters = {}
+    for key in ('start_date', 'end_date', 'customer_email'):
+        value = request.args.get(key, '').strip()
+        if value and key.endswith('_date'):
+            try:
+                datetime.strptime(value, '%Y-%m-%d')
+            except ValueError:
+                flash('Invalid date filter.', 'danger')
+                continue
+        if value:
+            filters[key] = value
+    return filters
+
+def sales_page_from_request():
+    """Load the transaction history page described by the query string (cursor, limit and filters)"""
+    filters = sales_filters_from_request()
+    limit = request.args.get('limit', SALES_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, MAX_SALES_PAGE_SIZE))
+    try:
+        sales, next_cursor = user_service.get_sales_page(request.args.get('cursor'), limit, **filters)
+    except ValueError:
+        flash('Invalid page cursor.', 'danger')
+        sales, next_cursor = user_service.get_sales_page(None, limit, **filters)
+    return sales, next_cursor, filters
+
+def receipt_fragment(template, sale_id, customer_id=None):
+    """
+    (customer id, rendered receipt) for a sale, or None if there is no such sale. With
+    customer_id, also None unless the sale belongs to that customer, checked before the
+    receipt is loaded or cached.
+    """
+    version = user_service.get_product_names_version()
+    cached = _receipts.get((template, sale_id))
+    if customer_id is not None:
+        # A sale's customer never changes, so even an outdated entry can answer this
+        if cached is not None:
+            owned = cached[1] == customer_id
+        else:
+            owned = user_service.customer_owns_sale(sale_id, customer_id)
+        if not owned:
+            return None
+    if cached is not None and cached[0] == version:
+        return cached[1:]
+    sale, items = user_service.get_receipt(sale_id)
+    if sale is None:
+        return None
+    fragment = Markup(render_template(template, sale=sale, items=items))
+    _receipts.set((template, sale_id), (version, sale[6], fragment))
+    return sale[6], fragment
+
+def receipt_response(page, receipt):
+    """Render a transaction detail page around a receipt with a strong ETag, answering revisits with 304"""
+    response = make_response(render_template(page, receipt=receipt))
+    response.add_etag()
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+def sales_export_response(filename):
+    """Stream the filtered sales (or their line items with ?kind=items) as CSV or JSON Lines"""
+    filters = sales_filters_from_request()
+    fmt = bulk_io.format_for(None, request.args.get('format'))
+    if request.args.get('kind') == 'items':
+        rows, fields, filename = user_service.iter_sale_items(**filters), SALE_ITEM_EXPORT_FIELDS, f'{filename}_items'
+    else:
+        rows, fields = user_service.iter_sales(**filters), SALE_EXPORT_FIELDS
+    chunks = bulk_io.write_records(rows, fields, fmt)
+    return Response(stream_with_context(chunks), mimetype=bulk_io.CONTENT_TYPES[fmt],
+                    headers={'Content-Disposition': f'attachment; filename={filename}.{fmt}'})
+
+@app.errorhandler(user_service.HashQueueFull)
+def hash_queue_full(e):
+    # Shed scrypt work quickly instead of letting a login burst tie up every worker
+    return str(e), 503, {'Retry-After': str(HASH_RETRY_AFTER)}
+
 @app.route('/')
 def home():
     return redirect(url_for('login'))
@@ -61,6 +238,8 @@ def register():
             user_service.create_user(first_name, middle_name, last_name, birthday, age, address, email, password, 'customer')
             flash('Registration successful! Please log in.', 'success')
             return redirect(url_for('login'))
+        except user_service.HashQueueFull:
+            raise
         except Exception as e:
             flash('Email already registered.', 'danger')
     return render_template('register.html')
@@ -70,9 +249,12 @@ def login():
     if request.method == 'POST':
         email = request.form['email']
         password = request.form['password']
-        user = auth_service.authenticate_user(email, password)
+        user = auth_service.authenticate_user(email, password, request.remote_addr)
         
-        if user == 'locked':
+        if user == 'throttled':
+            flash('Too many failed login attempts. Please wait a few minutes and try again.', 'danger')
+            return render_template('login.html'), 429
+        elif user == 'locked':
             flash('Account is locked due to too many failed login attempts. Please contact administrator.', 'danger')
         elif user:
             session['user_id'] = user[0]
@@ -103,23 +285,65 @@ def logout():
 @login_required
 @admin_required
 def admin_dashboard():
-    users = user_service.get_all_users()
-    products = user_service.get_all_products()
-    sales = user_service.get_sales_history()
+    stats = user_service.get_dashboard_stats()
+    sales = user_service.get_recent_sales(10)
     return render_template('admin/dashboard.html', 
-                         users=users, 
-                         products=products, 
                          sales=sales,
-                         user_count=len(users),
-                         product_count=len(products),
-                         sales_count=len(sales))
+                         user_count=stats['user_count'],
+                         product_count=stats['product_count'],
+                         sales_count=stats['sales_count'],
+                         total_revenue=stats['total_revenue'])
 
 @app.route('/admin/users')
 @login_required
 @admin_required
 def admin_users():
-    users = user_service.get_all_users()
-    return render_template('admin/users.html', users=users)
+    filters = {}
+    role = request.args.get('role', '').strip()
+    if role in user_service.USER_ROLES:
+        filters['role'] = role
+    search = request.args.get('q', '').strip()
+    search_by = request.args.get('search_by', 'last_name')
+    if search_by not in user_service.USER_SEARCH_FIELDS:
+        search_by = 'last_name'
+    if search:
+        filters['q'] = search
+        filters['search_by'] = search_by
+    
+    limit = request.args.get('limit', USERS_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, MAX_USERS_PAGE_SIZE))
+    page_args = (limit, filters.get('role'), search or None, search_by)
+    try:
+        users, next_cursor = user_service.get_users_page(request.args.get('cursor'), *page_args)
+    except ValueError:
+        flash('Invalid page cursor.', 'danger')
+        users, next_cursor = user_service.get_users_page(None, *page_args)
+    return render_template('admin/users.html', users=users, next_cursor=next_cursor, filters=filters)
+
+@app.route('/admin/users/import', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def admin_import_users():
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Please choose a file to import.', 'danger')
+            return render_template('admin/import_users.html')
+        
+        fmt = bulk_io.format_for(upload.filename, request.form.get('format'))
+        records = bulk_io.read_records(bulk_io.text_stream(upload.stream), fmt)
+        try:
+            imported, errors = user_service.import_users(records)
+        except UnicodeDecodeError:
+            # Batches before the bad bytes are already committed
+            flash('The file is not valid UTF-8 text. Rows before the invalid text were imported.', 'danger')
+            return render_template('admin/import_users.html')
+        
+        flash(f'Imported {imported} users.', 'success' if not errors else 'warning')
+        return render_template('admin/import_users.html', imported=imported, error_count=len(errors),
+                             errors=errors[:MAX_IMPORT_ERRORS_SHOWN])
+    
+    return render_template('admin/import_users.html')
 
 @app.route('/admin/add_user', methods=['GET', 'POST'])
 @login_required
@@ -140,6 +364,8 @@ def admin_add_user():
             user_service.create_user(first_name, middle_name, last_name, birthday, age, address, email, password, role)
             flash('User created successfully!', 'success')
             return redirect(url_for('admin_users'))
+        except user_service.HashQueueFull:
+            raise
         except Exception as e:
             flash('Email already registered.', 'danger')
     return render_template('admin/add_user.html')
@@ -262,20 +488,153 @@ def admin_delete_product(product_id):
         flash('Error deleting product.', 'danger')
     return redirect(url_for('admin_products'))
 
+@app.route('/admin/products/import', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def admin_import_products():
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Please choose a file to import.', 'danger')
+            return render_template('admin/import_products.html')
+        
+        fmt = bulk_io.format_for(upload.filename, request.form.get('format'))
+        records = bulk_io.read_records(bulk_io.text_stream(upload.stream), fmt)
+        try:
+            imported, errors = user_service.import_products(records)
+        except UnicodeDecodeError:
+            # Batches before the bad bytes are already committed
+            flash('The file is not valid UTF-8 text. Rows before the invalid text were imported.', 'danger')
+            return render_template('admin/import_products.html')
+        
+        flash(f'Imported {imported} products.', 'success' if not errors else 'warning')
+        return render_template('admin/import_products.html', imported=imported, error_count=len(errors),
+                             errors=errors[:MAX_IMPORT_ERRORS_SHOWN])
+    
+    return render_template('admin/import_products.html')
+
+@app.route('/admin/products/export')
+@login_required
+@admin_required
+def admin_export_products():
+    fmt = bulk_io.format_for(None, request.args.get('format'))
+    chunks = bulk_io.write_records(user_service.iter_products(), PRODUCT_EXPORT_FIELDS, fmt)
+    return Response(stream_with_context(chunks), mimetype=bulk_io.CONTENT_TYPES[fmt],
+                    headers={'Content-Disposition': f'attachment; filename=products.{fmt}'})
+
 @app.route('/admin/transactions')
 @login_required
 @admin_required
 def admin_transactions():
-    sales = user_service.get_sales_history()
-    return render_template('admin/transactions.html', sales=sales)
+    sales, next_cursor, filters = sales_page_from_request()
+    return render_template('admin/transactions.html', sales=sales, next_cursor=next_cursor, filters=filters)
+
+@app.route('/admin/transactions/export')
+@login_required
+@admin_required
+def admin_export_transactions():
+    return sales_export_response('transactions')
 
 @app.route('/admin/transaction/<int:sale_id>')
 @login_required
 @admin_required
 def admin_transaction_detail(sale_id):
-    sale = user_service.get_sale_by_id(sale_id)
-    items = user_service.get_sale_details(sale_id)
-    return render_template('admin/transaction_detail.html', sale=sale, items=items)
+    receipt = receipt_fragment('admin/receipt.html', sale_id)
+    if receipt is None:
+        flash('Transaction not found.', 'danger')
+        return redirect(url_for('admin_transactions'))
+    return receipt_response('admin/transaction_detail.html', receipt[1])
+
+@app.route('/metrics')
+@login_required
+@admin_required
+def admin_metrics():
+    gauges = {f'pos_hash_pool_{name}': value for name, value in user_service.get_hash_pool_stats().items()}
+    gauges.update((f'pos_group_commit_{name}', value) for name, value in user_service.get_group_commit_stats().items())
+    return Response(metrics.render(gauges), mimetype='text/plain; version=0.0.4')
+
+# Profiling wraps the decorated views themselves (see profiling.py), so requests are
+# sampled including the access checks above, and nothing is wrapped while it is off
+@app.route('/admin/profiling', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def admin_profiling():
+    if request.method == 'POST':
+        action = request.form.get('action')
+        if action == 'start':
+            try:
+                sample_percent = float(request.form.get('sample_percent') or 0)
+                if not 0 <= sample_percent <= 100:
+                    raise ValueError
+            except ValueError:
+                flash('Sample rate must be between 0 and 100 percent.', 'danger')
+                return redirect(url_for('admin_profiling'))
+            endpoints = [endpoint for endpoint in request.form.getlist('endpoints') if endpoint in app.view_functions]
+            if not sample_percent and not endpoints:
+                flash('Choose a sample rate or at least one endpoint to profile.', 'danger')
+                return redirect(url_for('admin_profiling'))
+            profiling.enable(app, sample_percent / 100, endpoints, PROFILER_EXCLUDED_ENDPOINTS)
+            flash('Profiling started.', 'success')
+        elif action == 'stop':
+            profiling.disable(app)
+            flash('Profiling stopped.', 'success')
+        elif action == 'reset':
+            profiling.reset()
+            flash('Profiles cleared.', 'success')
+        return redirect(url_for('admin_profiling'))
+    
+    endpoints = sorted(set(app.view_functions) - PROFILER_EXCLUDED_ENDPOINTS)
+    return render_template('admin/profiling.html', enabled=profiling.is_enabled(), settings=profiling.settings,
+                         endpoints=endpoints, profiles=profiling.summary())
+
+@app.route('/admin/profiling/<name>')
+@login_required
+@admin_required
+def admin_profile_report(name):
+    sort = request.args.get('sort', 'cumulative')
+    if sort not in PROFILE_SORT_KEYS:
+        sort = 'cumulative'
+    report = profiling.report(name, sort)
+    if report is None:
+        flash('That endpoint has not been profiled yet.', 'warning')
+        return redirect(url_for('admin_profiling'))
+    return render_template('admin/profile_report.html', endpoint=name, report=report, sort=sort,
+                         sort_keys=PROFILE_SORT_KEYS)
+
+@app.route('/admin/profiling/<name>/download')
+@login_required
+@admin_required
+def admin_profile_download(name):
+    path = profiling.dump(name)
+    if path is None:
+        flash('That endpoint has not been profiled yet.', 'warning')
+        return redirect(url_for('admin_profiling'))
+    return send_file(path, as_attachment=True, download_name=f'{name}.pstats')
+
+@app.route('/admin/reports')
+@login_required
+@admin_required
+def admin_reports():
+    # Rollups are bucketed by the UTC sale timestamp
+    today = datetime.utcnow().date()
+    dates = {
+        'end_date': request.args.get('end_date', today.isoformat()),
+        'start_date': request.args.get('start_date', (today - timedelta(days=REPORT_DAYS - 1)).isoformat()),
+    }
+    dates['day'] = request.args.get('day', dates['end_date'])
+    for key, value in dates.items():
+        try:
+            datetime.strptime(value, '%Y-%m-%d')
+        except ValueError:
+            flash('Invalid date.', 'danger')
+            return redirect(url_for('admin_reports'))
+    
+    return render_template('admin/reports.html',
+                         daily=user_service.get_daily_sales(dates['start_date'], dates['end_date']),
+                         hourly=user_service.get_hourly_sales(dates['day']),
+                         top_products=user_service.get_top_products(dates['start_date'], dates['end_date']),
+                         sellers=user_service.get_seller_sales(dates['start_date'], dates['end_date']),
+                         **dates)
 
 # Seller Routes
 @app.route('/seller/dashboard')
@@ -284,13 +643,15 @@ def seller_dashboard():
     if session.get('role') not in ['admin', 'seller']:
         return redirect(url_for('dashboard'))
     
-    products = user_service.get_all_products()
-    sales = user_service.get_sales_history()
+    stats = user_service.get_dashboard_stats()
+    low_stock_products = user_service.get_low_stock_products(10)
+    sales = user_service.get_recent_sales(10)
     return render_template('seller/dashboard.html', 
-                         products=products, 
+                         low_stock_products=low_stock_products, 
                          sales=sales,
-                         product_count=len(products),
-                         sales_count=len(sales))
+                         product_count=stats['product_count'],
+                         sales_count=stats['sales_count'],
+                         total_revenue=stats['total_revenue'])
 
 @app.route('/seller/products')
 @login_required
@@ -375,16 +736,26 @@ def seller_delete_product(product_id):
 @login_required
 @seller_required
 def seller_transactions():
-    sales = user_service.get_sales_history()
-    return render_template('seller/transactions.html', sales=sales)
+    sales, next_cursor, filters = sales_page_from_request()
+    # Summarize the same filtered sales the table pages through
+    stats = user_service.get_sales_summary(**filters)
+    return render_template('seller/transactions.html', sales=sales, next_cursor=next_cursor, filters=filters, stats=stats)
+
+@app.route('/seller/transactions/export')
+@login_required
+@seller_required
+def seller_export_transactions():
+    return sales_export_response('transactions')
 
 @app.route('/seller/transaction/<int:sale_id>')
 @login_required
 @seller_required
 def seller_transaction_detail(sale_id):
-    sale = user_service.get_sale_by_id(sale_id)
-    items = user_service.get_sale_details(sale_id)
-    return render_template('seller/transaction_detail.html', sale=sale, items=items)
+    receipt = receipt_fragment('seller/receipt.html', sale_id)
+    if receipt is None:
+        flash('Transaction not found.', 'danger')
+        return redirect(url_for('seller_transactions'))
+    return receipt_response('seller/transaction_detail.html', receipt[1])
 
 # Customer Routes
 @app.route('/customer/dashboard')
@@ -393,13 +764,15 @@ def customer_dashboard():
     if session.get('role') != 'customer':
         return redirect(url_for('dashboard'))
     
-    products = user_service.get_all_products()
-    sales = user_service.get_sales_history('customer', session.get('user_id'))
+    stats = user_service.get_dashboard_stats('customer', session.get('user_id'))
+    products = user_service.get_all_products(limit=6)
+    sales = user_service.get_recent_sales(5, 'customer', session.get('user_id'))
     return render_template('customer/dashboard.html', 
                          products=products, 
                          sales=sales,
-                         product_count=len(products),
-                         sales_count=len(sales))
+                         product_count=stats['product_count'],
+                         sales_count=stats['sales_count'],
+                         total_revenue=stats['total_revenue'])
 
 @app.route('/customer/products')
 @login_required
@@ -429,47 +802,29 @@ def customer_purchase():
             return redirect(url_for('customer_purchase'))
         
         # Process the purchase
+        customer = {
+            'id': session.get('user_id'),
+            'name': f"{session.get('first_name')} {session.get('last_name')}",
+            'email': session.get('email'),
+        }
         try:
-            total = 0
-            items_to_purchase = []
-            
-            for product_id, quantity in quantities.items():
-                product = user_service.get_product_by_id(product_id)
-                if not product:
-                    flash(f'Product not found.', 'danger')
-                    return redirect(url_for('customer_purchase'))
-                
-                if product[3] < quantity:  # product[3] is quantity
-                    flash(f'Not enough stock for {product[1]}.', 'danger')
-                    return redirect(url_for('customer_purchase'))
-                
-                subtotal = product[4] * quantity  # product[4] is price
-                total += subtotal
-                items_to_purchase.append({
-                    'product_id': product_id,
-                    'quantity': quantity,
-                    'price': product[4],
-                    'subtotal': subtotal
-                })
-            
-            # Record the sale
-            customer_name = f"{session.get('first_name')} {session.get('last_name')}"
-            sale_id = user_service.record_sale(total, customer_name, session.get('email'), session.get('user_id'))
-            
-            # Add sale items and update stock
-            for item in items_to_purchase:
-                user_service.add_sale_item(sale_id, item['product_id'], item['quantity'], item['price'])
-                user_service.update_product_stock(item['product_id'], item['quantity'])
-            
+            sale_id = user_service.checkout(quantities, customer)
             flash('Purchase completed successfully!', 'success')
             return redirect(url_for('customer_transaction_detail', sale_id=sale_id))
-            
+        except user_service.CheckoutError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('customer_purchase'))
         except Exception as e:
             flash(f'Error processing purchase: {e}', 'danger')
             return redirect(url_for('customer_purchase'))
     
-    products = user_service.get_all_products()
-    return render_template('customer/purchase.html', products=products)
+    query = request.args.get('q', '').strip()
+    if query:
+        products = user_service.search_products(query, MAX_PRODUCT_SEARCH_LIMIT)
+    else:
+        products = user_service.get_all_products(limit=PURCHASE_PAGE_LIMIT)
+    return render_template('customer/purchase.html', products=products, query=query,
+                         limited=not query and len(products) == PURCHASE_PAGE_LIMIT)
 
 @app.route('/customer/transactions')
 @login_required
@@ -482,15 +837,34 @@ def customer_transactions():
 @login_required
 @customer_required
 def customer_transaction_detail(sale_id):
-    sale = user_service.get_sale_by_id(sale_id)
-    items = user_service.get_sale_details(sale_id)
-    
     # Verify customer can only see their own transactions
-    if sale[3] != session.get('email'):  # sale[3] is customer_email
+    receipt = receipt_fragment('customer/receipt.html', sale_id, session.get('user_id'))
+    if receipt is None:
         flash('Access denied.', 'danger')
         return redirect(url_for('customer_transactions'))
     
-    return render_template('customer/transaction_detail.html', sale=sale, items=items)
+    return receipt_response('customer/transaction_detail.html', receipt[1])
+
+# Product lookup (JSON) for search boxes and barcode scanners
+def product_json(product):
+    return {'id': product[0], 'name': product[1], 'sku': product[2], 'quantity': product[3], 'price': product[4]}
+
+@app.route('/products/search')
+@login_required
+def product_search():
+    query = request.args.get('q', '').strip()
+    limit = request.args.get('limit', PRODUCT_SEARCH_LIMIT, type=int)
+    limit = max(1, min(limit, MAX_PRODUCT_SEARCH_LIMIT))
+    products = user_service.search_products(query, limit)
+    return jsonify([product_json(product) for product in products])
+
+@app.route('/products/sku/<path:sku>')
+@login_required
+def product_by_sku(sku):
+    product = user_service.get_product_by_sku(sku.strip())
+    if not product:
+        return jsonify({'error': 'Product not found.'}), 404
+    return jsonify(product_json(product))
 
 # General dashboard redirect
 @app.route('/dashboard')
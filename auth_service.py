@@ -1,24 +1,106 @@
+import threading
+import time
+from collections import OrderedDict, deque
 import user_service
 
 MAX_LOGIN_ATTEMPTS = 3
 
-def authenticate_user(email, password):
-    # Check if user is locked
-    if user_service.is_user_locked(email):
-        return 'locked'
+# Failed logins are counted in memory over a sliding window, so rejected and
+# brute-force attempts never touch the database. The users row is only written
+# when an account crosses MAX_LOGIN_ATTEMPTS and gets locked.
+EMAIL_WINDOW_SECONDS = 15 * 60
+IP_WINDOW_SECONDS = 5 * 60
+MAX_ATTEMPTS_PER_IP = 20
+MAX_TRACKED_KEYS = 100000
+
+class SlidingWindowCounter:
+    """Counts events per key over the last window seconds, tracking at most max_keys keys"""
+
+    def __init__(self, window, max_keys=MAX_TRACKED_KEYS):
+        self.window = window
+        self.max_keys = max_keys
+        self._events = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _prune(self, key, now):
+        events = self._events.get(key)
+        if events is None:
+            return None
+        while events and events[0] <= now - self.window:
+            events.popleft()
+        if not events:
+            del self._events[key]
+            return None
+        return events
+
+    def count(self, key):
+        with self._lock:
+            events = self._prune(key, time.monotonic())
+            return len(events) if events else 0
+
+    def add(self, key):
+        """Record an event and return the number of events now in the window"""
+        now = time.monotonic()
+        with self._lock:
+            events = self._prune(key, now)
+            if events is None:
+                events = self._events[key] = deque()
+            events.append(now)
+            self._events.move_to_end(key)
+            while len(self._events) > self.max_keys:
+                self._events.popitem(last=False)
+            return len(events)
+
+    def reset(self, key):
+        with self._lock:
+            self._events.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._events.clear()
+
+_failures_by_email = SlidingWindowCounter(EMAIL_WINDOW_SECONDS)
+_failures_by_ip = SlidingWindowCounter(IP_WINDOW_SECONDS)
+
+def authenticate_user(email, password, ip=None):
+    """
+    Return the user row on success, None for bad credentials, 'locked' for a locked
+    account or 'throttled' when the email or client IP has failed too often recently.
+    """
+    email_key = email.strip().lower()
+    # Over-limit attempts are turned away before any SQL or scrypt work
+    if _failures_by_email.count(email_key) >= MAX_LOGIN_ATTEMPTS:
+        return 'throttled'
+    if ip and _failures_by_ip.count(ip) >= MAX_ATTEMPTS_PER_IP:
+        return 'throttled'
+    
+    # One read for the user, lock state and attempt count
+    user = user_service.get_login_user(email)
+    if not user:
+        _record_failure(email_key, ip)
+        return None
     
-    # Check login attempts
-    attempts = user_service.get_login_attempts(email)
-    if attempts >= MAX_LOGIN_ATTEMPTS:
+    login_attempts, is_locked = user[10] or 0, user[11]
+    if is_locked:
+        return 'locked'
+    if login_attempts >= MAX_LOGIN_ATTEMPTS:
         user_service.lock_user(email)
         return 'locked'
     
-    user = user_service.get_user_by_email(email)
-    if user and user_service.verify_password_scrypt(password, user[8]):  # password is at index 8
-        # Reset login attempts on successful login
-        user_service.reset_login_attempts(email)
+    if user_service.verify_password_scrypt(password, user[8]):  # password is at index 8
+        _failures_by_email.reset(email_key)
+        # Only write when there is something to reset
+        if login_attempts:
+            user_service.reset_login_attempts(email)
         return user
-    else:
-        # Increment login attempts on failed login
-        user_service.increment_login_attempts(email)
-        return None 
\ No newline at end of file
+    
+    failures = _record_failure(email_key, ip)
+    if failures == MAX_LOGIN_ATTEMPTS:
+        # The account just crossed the limit: persist the lockout once
+        user_service.lock_user(email, failures)
+    return None
+
+def _record_failure(email_key, ip):
+    if ip:
+        _failures_by_ip.add(ip)
+    return _failures_by_email.add(email_key)
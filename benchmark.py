@@ -0,0 +1,299 @@
+"""
+Load benchmark for the POS hot paths.
+
+Generates a seeded synthetic database (users, products, sales and sale_items), then
+drives the Flask test client through the login, catalog, purchase, dashboard and
+transaction history scenarios from several threads at once, and prints p50/p99
+latency and throughput per scenario as JSON so runs can be compared.
+
+Usage:
+    python benchmark.py --scale 100000 --concurrency 8 --requests 500 --output run.json
+    python benchmark.py --db bench.db --reuse            # skip generation on later runs
+    python benchmark.py --db bench.db --reuse --group-commit --scenarios purchase
+
+--scale is the number of sales; users, products and line items scale with it.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import user_service
+
+BENCH_PASSWORD = 'benchmark'
+BATCH_SIZE = 10000
+HISTORY_DAYS = 365
+ITEMS_PER_SALE = 3
+SCENARIOS = ('login', 'catalog', 'purchase', 'dashboard', 'history')
+
+# Form posts redirect on failure too, so these only count as successful when they land here
+SUCCESS_REDIRECTS = {'login': '/customer/dashboard', 'purchase': '/customer/transaction/'}
+
+
+def customer_email(i):
+    return f'customer{i}@bench.pos'
+
+
+def product_price(i):
+    return round(5 + (i * 37 % 2000) / 4, 2)
+
+
+def _batches(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _insert(conn, sql, rows):
+    for batch in _batches(rows):
+        conn.executemany(sql, batch)
+        conn.commit()
+
+
+def generate(users, products, sales, seed=42):
+    """Fill the current user_service.DATABASE with synthetic rows; every customer's password is BENCH_PASSWORD"""
+    rng = random.Random(seed)
+    conn = user_service.get_db()
+    password = user_service.hash_password_scrypt(BENCH_PASSWORD)
+
+    first_user = conn.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM users').fetchone()[0]
+    _insert(conn, '''INSERT INTO users (id, first_name, middle_name, last_name, birthday, age, address, email, password, role)
+                     VALUES (?, ?, '', ?, '1990-01-01', 30, 'Benchmark Street', ?, ?, ?)''',
+            ((first_user + i, f'Bench{i}', f'User{i}', customer_email(i), password, 'seller' if i % 50 == 49 else 'customer')
+             for i in range(users)))
+
+    first_product = conn.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM products').fetchone()[0]
+    _insert(conn, 'INSERT INTO products (id, name, sku, quantity, price) VALUES (?, ?, ?, ?, ?)',
+            ((first_product + i, f'Product {i}', f'BENCH{i:08d}', 1000000, product_price(i)) for i in range(products)))
+
+    first_sale = conn.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM sales').fetchone()[0]
+    start = datetime.utcnow() - timedelta(days=HISTORY_DAYS)
+    span = HISTORY_DAYS * 86400
+
+    def sales_and_items():
+        for i in range(sales):
+            customer = rng.randrange(users)
+            timestamp = (start + timedelta(seconds=span * i // max(sales, 1))).strftime('%Y-%m-%d %H:%M:%S')
+            items = []
+            for _ in range(rng.randint(1, ITEMS_PER_SALE * 2 - 1)):
+                product = rng.randrange(products)
+                items.append((first_product + product, rng.randint(1, 3), product_price(product)))
+            total = sum(quantity * price for _, quantity, price in items)
+            yield ((first_sale + i, timestamp, f'Bench{customer} User{customer}', customer_email(customer), total,
+                    first_user + customer, first_user + customer), items)
+
+    for batch in _batches(sales_and_items()):
+        conn.executemany('''INSERT INTO sales (id, timestamp, customer_name, customer_email, total, created_by, customer_id)
+                            VALUES (?, ?, ?, ?, ?, ?, ?)''', [sale for sale, _ in batch])
+        conn.executemany('INSERT INTO sale_items (sale_id, product_id, quantity, price) VALUES (?, ?, ?, ?)',
+                         [(sale[0],) + item for sale, items in batch for item in items])
+        conn.commit()
+
+    user_service.rebuild_sales_rollups()
+    user_service.clear_catalog_cache()
+
+
+def _login(client, email, password):
+    return client.post('/login', data={'email': email, 'password': password})
+
+
+# Each scenario makes one request with the worker's clients: 'customer' is logged in
+# as that worker's customer and 'admin' as the default admin.
+
+def scenario_login(clients, rng, world):
+    client = clients['customer']
+    client.get('/logout')
+    return _login(client, customer_email(rng.randrange(world['customers'])), BENCH_PASSWORD)
+
+
+def scenario_catalog(clients, rng, world):
+    client = clients['customer']
+    product = rng.randrange(world['products'])
+    choice = rng.randrange(3)
+    if choice == 0:
+        return client.get('/customer/purchase')
+    if choice == 1:
+        return client.get(f'/products/search?q=Product {product}')
+    return client.get(f'/products/sku/BENCH{product:08d}')
+
+
+def scenario_purchase(clients, rng, world):
+    data = {'products': []}
+    for product_id in rng.sample(range(world['first_product'], world['first_product'] + world['products']),
+                                 min(rng.randint(1, ITEMS_PER_SALE), world['products'])):
+        data['products'].append(str(product_id))
+        data[f'quantity_{product_id}'] = '1'
+    return clients['customer'].post('/customer/purchase', data=data)
+
+
+def scenario_dashboard(clients, rng, world):
+    if rng.random() < 0.5:
+        return clients['admin'].get('/admin/dashboard')
+    return clients['customer'].get('/customer/dashboard')
+
+
+def scenario_history(clients, rng, world):
+    choice = rng.randrange(3)
+    if choice == 0:
+        return clients['admin'].get('/admin/transactions')
+    if choice == 1:
+        day = datetime.utcnow() - timedelta(days=rng.randrange(HISTORY_DAYS))
+        return clients['admin'].get(f"/admin/transactions?start_date={day:%Y-%m-%d}&end_date={day:%Y-%m-%d}")
+    return clients['customer'].get('/customer/transactions')
+
+
+def _clients(app, worker, world):
+    customer = app.test_client()
+    _login(customer, customer_email(worker % world['customers']), BENCH_PASSWORD)
+    admin = app.test_client()
+    _login(admin, 'admin@pos.com', 'admin123')
+    return {'customer': customer, 'admin': admin}
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+def run_scenario(app, name, world, concurrency, requests, warmup, seed):
+    """Issue requests calls of one scenario from concurrency threads; returns its latency summary"""
+    step = globals()[f'scenario_{name}']
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    per_worker = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        clients = _clients(app, index, world)
+        local_latencies = []
+        local_errors = 0
+        for i in range(warmup + per_worker[index]):
+            began = time.perf_counter()
+            response = step(clients, rng, world)
+            elapsed = time.perf_counter() - began
+            if i < warmup:
+                continue
+            local_latencies.append(elapsed)
+            expected = SUCCESS_REDIRECTS.get(name)
+            if response.status_code >= 400 or (expected and expected not in (response.location or '')):
+                local_errors += 1
+        with lock:
+            latencies.extend(local_latencies)
+            errors.append(local_errors)
+
+    began = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    wall = time.perf_counter() - began
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': sum(errors),
+        'seconds': round(wall, 3),
+        'throughput_rps': round(len(latencies) / wall, 2) if wall else 0.0,
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p90_ms': round(percentile(latencies, 0.90) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3) if latencies else 0.0,
+    }
+
+
+def world_from_db():
+    """Row counts and id ranges of the benchmark data already in the database"""
+    conn = user_service.get_db()
+    customers = conn.execute("SELECT COUNT(*) FROM users WHERE email LIKE 'customer%@bench.pos'").fetchone()[0]
+    first_product, products = conn.execute("SELECT MIN(id), COUNT(*) FROM products WHERE sku LIKE 'BENCH%'").fetchone()
+    sales = conn.execute('SELECT COUNT(*) FROM sales').fetchone()[0]
+    items = conn.execute('SELECT COUNT(*) FROM sale_items').fetchone()[0]
+    return {'customers': customers, 'products': products, 'first_product': first_product, 'sales': sales, 'sale_items': items}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--scale', type=int, default=10000, help='number of sales to generate (1k to 10M)')
+    parser.add_argument('--users', type=int, help='customers to generate (default scale / 10, at least 100)')
+    parser.add_argument('--products', type=int, help='products to generate (default scale / 100, at least 50)')
+    parser.add_argument('--db', help='database file (default: a new temporary file)')
+    parser.add_argument('--reuse', action='store_true', help='use the benchmark data already in --db')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='comma separated subset of ' + ', '.join(SCENARIOS))
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=200, help='measured requests per scenario')
+    parser.add_argument('--warmup', type=int, default=5, help='unmeasured requests per worker before measuring')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--group-commit', action='store_true', help='sell checkouts through the group commit writer')
+    parser.add_argument('--output', help='write the JSON report here as well as to stdout')
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    users = args.users or max(100, args.scale // 10)
+    products = args.products or max(50, args.scale // 100)
+
+    user_service.close_pool()
+    user_service.DATABASE = args.db or os.path.join(tempfile.mkdtemp(), 'bench.db')
+    reuse = args.reuse and os.path.exists(user_service.DATABASE)
+    user_service.init_db()
+
+    generation_seconds = None
+    if not reuse:
+        began = time.perf_counter()
+        generate(users, products, args.scale, args.seed)
+        generation_seconds = round(time.perf_counter() - began, 3)
+    world = world_from_db()
+    if not world['customers'] or not world['products']:
+        parser.error(f'{user_service.DATABASE} has no benchmark data; run without --reuse first')
+
+    from app import app
+    app.testing = True
+    report = {
+        'config': {
+            'database': user_service.DATABASE,
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+            'warmup': args.warmup,
+            'seed': args.seed,
+            'group_commit': args.group_commit,
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+        },
+        'data': dict(world, generation_seconds=generation_seconds),
+        'scenarios': {},
+    }
+    if args.group_commit:
+        user_service.start_group_commit()
+    for name in scenarios:
+        report['scenarios'][name] = run_scenario(app, name, world, args.concurrency, args.requests, args.warmup, args.seed)
+        user_service.release_db()
+    if args.group_commit:
+        user_service.stop_group_commit()
+        report['group_commit'] = user_service.get_group_commit_stats()
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Streaming CSV and JSON Lines readers and writers used by the bulk imports and exports.
+
+Readers take a text stream and yield one record at a time, and writers take an
+iterable of rows and yield the encoded output in chunks, so neither side ever holds
+a whole file in memory.
+"""
+import csv
+import io
+import json
+import os
+
+FORMATS = ('csv', 'jsonl')
+CONTENT_TYPES = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+# Rows encoded per chunk handed to the response
+WRITE_CHUNK_ROWS = 500
+
+
+def format_for(filename, requested=None):
+    """The format named by requested, else the one implied by the file extension (CSV by default)"""
+    if requested in FORMATS:
+        return requested
+    extension = os.path.splitext(filename or '')[1].lower().lstrip('.')
+    if extension in ('jsonl', 'ndjson', 'json'):
+        return 'jsonl'
+    return 'csv'
+
+
+def text_stream(binary):
+    """Decode an uploaded file as UTF-8 (with or without a BOM) without reading it all"""
+    return io.TextIOWrapper(binary, encoding='utf-8-sig', newline='')
+
+
+def read_records(stream, fmt):
+    """
+    Yield (line number, record) for each record in a text stream. Records are dicts
+    with lower-cased keys, or None for a line that could not be parsed.
+    """
+    if fmt == 'jsonl':
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            if isinstance(record, dict):
+                record = {str(key).strip().lower(): value for key, value in record.items()}
+            else:
+                record = None
+            yield line_number, record
+        return
+
+    reader = csv.reader(stream)
+    header = None
+    try:
+        for row in reader:
+            if not any(field.strip() for field in row):
+                continue
+            if header is None:
+                header = [field.strip().lower() for field in row]
+                continue
+            record = dict(zip(header, row)) if len(row) == len(header) else None
+            yield reader.line_num, record
+    except csv.Error:
+        # A broken quote makes the rest of the file unreadable
+        yield reader.line_num, None
+
+
+def write_records(rows, fields, fmt):
+    """Yield rows (tuples ordered like fields) encoded as CSV with a header row, or as JSON Lines"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(fields)
+    pending = 0
+    for row in rows:
+        if writer:
+            writer.writerow(row)
+        else:
+            buffer.write(json.dumps(dict(zip(fields, row)), default=str))
+            buffer.write('\n')
+        pending += 1
+        if pending >= WRITE_CHUNK_ROWS:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if buffer.tell():
+        yield buffer.getvalue()
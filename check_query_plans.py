@@ -0,0 +1,204 @@
+"""
+Run EXPLAIN QUERY PLAN on every query user_service issues against a seeded
+database and fail if a hot query falls back to a full table scan or sorts
+its results through a temporary B-tree.
+
+Usage: python check_query_plans.py
+"""
+import inspect
+import os
+import re
+import sys
+import tempfile
+
+import user_service
+
+# Schema setup runs once at startup, so its plans are not checked
+SETUP_FUNCTIONS = {'init_db', 'migrate_db', 'create_indexes', 'create_default_admin', 'rebuild_sales_rollups'}
+
+# Report queries aggregate a bounded date range of rollup rows, so sorting the
+# aggregated rows in a temporary B-tree is expected
+REPORT_AGGREGATES = {'get_top_products', 'get_seller_sales'}
+
+# Tables that a function scans on purpose because it returns (nearly) all of them
+FULL_LISTINGS = {
+    'get_all_users': {'users'},
+    'get_all_products': {'products'},
+    'iter_products': {'products'},
+    'get_dashboard_stats': {'dashboard_stats'},
+    'get_sales_summary': {'dashboard_stats'},
+}
+
+# Listings whose rows must come back in a fixed order, whatever index the planner picks;
+# each maps to a key function over one returned row
+ORDERED_LISTINGS = {
+    'get_all_products': lambda product: product[0],
+}
+
+BAD_PLAN = re.compile(r'^SCAN (\w+)$|USE TEMP B-TREE FOR (?:RIGHT PART OF |LAST TERM OF )?ORDER BY')
+
+
+def seed(conn, customers=200, products=300, sales=2000):
+    """Fill the database with enough rows that the planner has real choices to make"""
+    c = conn.cursor()
+    c.executemany('''INSERT INTO users (first_name, middle_name, last_name, birthday, age, address, email, password, role)
+                     VALUES (?, '', ?, '1990-01-01', 30, 'Address', ?, 'x', ?)''',
+                  [(f'First{i}', f'Last{i}', f'user{i}@pos.com', 'seller' if i % 20 == 0 else 'customer')
+                   for i in range(customers)])
+    c.executemany('INSERT INTO products (name, sku, quantity, price, is_deleted) VALUES (?, ?, ?, ?, ?)',
+                  [(f'Product {i}', f'SKU{i:05d}', i % 50, 10.0 + i, 1 if i % 25 == 0 else 0)
+                   for i in range(products)])
+    c.executemany('''INSERT INTO sales (timestamp, customer_name, customer_email, total, created_by, customer_id)
+                     VALUES (?, ?, ?, ?, ?, (SELECT id FROM users WHERE email = ?))''',
+                  [(f'2026-{1 + i % 12:02d}-{1 + i % 28:02d} {i % 24:02d}:00:00', f'First{i % customers}',
+                    f'user{i % customers}@pos.com', 25.0, 1, f'user{i % customers}@pos.com') for i in range(sales)])
+    c.executemany('INSERT INTO sale_items (sale_id, product_id, quantity, price) VALUES (?, ?, ?, ?)',
+                  [(1 + i // 3, 1 + i % products, 1, 10.0) for i in range(sales * 3)])
+    conn.commit()
+    user_service.rebuild_sales_rollups()
+
+
+def checks():
+    """(function name, callable) pairs covering every query in user_service; mutations come last"""
+    us = user_service
+    conn = us.get_db()
+    # Resolve ids up front so the lookups are not traced as part of the checked calls
+    users = {i: conn.execute('SELECT id FROM users WHERE email = ?', (f'user{i}@pos.com',)).fetchone()[0] for i in range(20)}
+    products = {i: conn.execute('SELECT id FROM products WHERE sku = ?', (f'SKU{i:05d}',)).fetchone()[0] for i in range(20)}
+    user, product = users.get, products.get
+    cursor = us.encode_sales_cursor('2026-06-15 12:00:00', 1000)
+    return [
+        ('get_user_by_email', lambda: us.get_user_by_email('user5@pos.com')),
+        ('get_users_page', lambda: us.get_users_page(None, 50)),
+        ('get_users_page', lambda: us.get_users_page('|40', 50, role='customer')),
+        ('get_users_page', lambda: us.get_users_page('last1|12', 20, search='LAST1')),
+        ('get_users_page', lambda: us.get_users_page(None, 20, role='seller', search='user1', search_by='email')),
+        ('get_users_page', lambda: us.get_users_page('user12@pos.com|13', 20, search='user1', search_by='email')),
+        ('get_user_by_id', lambda: us.get_user_by_id(user(5))),
+        ('get_principal', lambda: (us.invalidate_principal(user(5)), us.get_principal(user(5)))),
+        ('get_all_users', lambda: us.get_all_users()),
+        ('get_all_staff', lambda: us.get_all_staff()),
+        ('get_login_user', lambda: us.get_login_user('user5@pos.com')),
+        ('is_user_locked', lambda: us.is_user_locked('user5@pos.com')),
+        ('get_login_attempts', lambda: us.get_login_attempts('user5@pos.com')),
+        ('get_all_products', lambda: us.get_all_products(limit=6)),
+        ('get_all_products', lambda: us.get_all_products()),
+        ('get_product_by_id', lambda: us.get_product_by_id(product(7))),
+        ('search_products', lambda: us.search_products('Prod 1')),
+        ('get_product_by_sku', lambda: us.get_product_by_sku('SKU00007')),
+        ('iter_products', lambda: list(us.iter_products())),
+        ('get_low_stock_products', lambda: us.get_low_stock_products(10)),
+        ('get_sales_history', lambda: us.get_sales_history('customer', user(5))),
+        ('get_sale_details', lambda: us.get_sale_details(42)),
+        ('get_sale_by_id', lambda: us.get_sale_by_id(42)),
+        ('get_receipt', lambda: us.get_receipt(42)),
+        ('customer_owns_sale', lambda: us.customer_owns_sale(42, user(5))),
+        ('get_dashboard_stats', lambda: us.get_dashboard_stats('customer', user(5))),
+        ('get_recent_sales', lambda: us.get_recent_sales(10)),
+        ('get_recent_sales', lambda: us.get_recent_sales(5, 'customer', user(5))),
+        ('get_sales_page', lambda: us.get_sales_page(None, 50)),
+        ('get_sales_page', lambda: us.get_sales_page(cursor, 50, start_date='2026-03-01', end_date='2026-03-31')),
+        ('get_sales_page', lambda: us.get_sales_page(cursor, 50, customer_email='user5@pos.com')),
+        ('get_sales_summary', lambda: us.get_sales_summary()),
+        ('get_sales_summary', lambda: us.get_sales_summary('2026-03-01', '2026-03-31')),
+        ('get_sales_summary', lambda: us.get_sales_summary(customer_email='user5@pos.com')),
+        ('iter_sales', lambda: list(us.iter_sales('2026-03-01', '2026-03-31'))),
+        ('iter_sales', lambda: list(us.iter_sales(customer_email='user5@pos.com'))),
+        ('iter_sale_items', lambda: list(us.iter_sale_items('2026-03-01', '2026-03-31'))),
+        ('iter_sale_items', lambda: list(us.iter_sale_items(customer_email='user5@pos.com'))),
+        ('get_daily_sales', lambda: us.get_daily_sales('2026-03-01', '2026-03-31')),
+        ('get_hourly_sales', lambda: us.get_hourly_sales('2026-03-05')),
+        ('get_top_products', lambda: us.get_top_products('2026-03-01', '2026-03-31')),
+        ('get_seller_sales', lambda: us.get_seller_sales('2026-03-01', '2026-03-31')),
+        ('sync_caches', lambda: us.sync_caches()),
+        ('sync_caches', lambda: (us.update_product_stock(product(13), 1), us.sync_caches())),
+        ('create_user', lambda: us.create_user('New', '', 'User', '1990-01-01', 30, 'Address', 'new@pos.com', 'secret')),
+        ('update_user', lambda: us.update_user(user(6), 'First6', '', 'Last6', '1990-01-01', 30, 'Address', 'user6@pos.com', 'customer')),
+        ('set_user_role', lambda: us.set_user_role(user(6), 'seller')),
+        ('increment_login_attempts', lambda: us.increment_login_attempts('user7@pos.com')),
+        ('lock_user', lambda: us.lock_user('user7@pos.com', 3)),
+        ('reset_login_attempts', lambda: us.reset_login_attempts('user7@pos.com')),
+        ('add_product', lambda: us.add_product('Fresh', 'SKU-NEW', 5, 9.5)),
+        ('import_products', lambda: us.import_products([(2, {'name': 'Product 12', 'sku': 'SKU00012', 'quantity': '3', 'price': '22'}),
+                                                        (3, {'name': 'Imported', 'sku': 'SKU-IMP', 'quantity': '1', 'price': '5'})])),
+        ('import_users', lambda: us.import_users([(2, {'first_name': 'First5', 'last_name': 'Last5', 'birthday': '1990-01-01', 'age': '30',
+                                                       'address': 'Address', 'email': 'user5@pos.com', 'password': 'x'}),
+                                                  (3, {'first_name': 'Bulk', 'last_name': 'User', 'birthday': '1990-01-01', 'age': '30',
+                                                       'address': 'Address', 'email': 'bulk@pos.com', 'password': 'x'})], processes=1)),
+        ('update_product', lambda: us.update_product(product(8), 'Product 8', 'SKU00008', 40, 18.0)),
+        ('update_product_stock', lambda: us.update_product_stock(product(8), 1)),
+        ('record_sale', lambda: us.record_sale(10.0, 'Walk-in', 'user9@pos.com', 1)),
+        ('add_sale_item', lambda: us.add_sale_item(1, product(8), 1, 18.0)),
+        ('checkout', lambda: us.checkout({product(8): 1, product(9): 1}, {'id': user(9), 'name': 'First9 Last9', 'email': 'user9@pos.com'})),
+        ('delete_product', lambda: us.delete_product(product(10))),
+        ('delete_user', lambda: us.delete_user(user(11))),
+    ]
+
+
+def query_functions():
+    """Public user_service functions that talk to the database"""
+    return {name for name, fn in vars(user_service).items()
+            if inspect.isfunction(fn) and not name.startswith('_') and '= get_db()' in inspect.getsource(fn)}
+
+
+def explain(conn, statement):
+    return [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {statement}')]
+
+
+def main():
+    workdir = tempfile.mkdtemp()
+    user_service.close_pool()
+    user_service.DATABASE = os.path.join(workdir, 'plans.db')
+    user_service.init_db()
+    conn = user_service.get_db()
+    seed(conn)
+
+    failures = []
+    checked = set()
+    for name, call in checks():
+        # Every call must reach the database for its plan to be checked
+        user_service.clear_catalog_cache()
+        statements = []
+        conn.set_trace_callback(statements.append)
+        try:
+            call()
+        finally:
+            conn.set_trace_callback(None)
+        checked.add(name)
+
+        for statement in statements:
+            sql = statement.lstrip().upper()
+            if not (sql.startswith(('SELECT', 'UPDATE', 'DELETE', 'WITH')) or (sql.startswith('INSERT') and 'SELECT' in sql)):
+                continue
+            plan = explain(conn, statement)
+            allowed = FULL_LISTINGS.get(name, set())
+            for line in plan:
+                match = BAD_PLAN.search(line)
+                if match and match.group(1) is None and name in REPORT_AGGREGATES:
+                    continue
+                if match and match.group(1) not in allowed:
+                    failures.append((name, ' '.join(statement.split()), plan))
+                    break
+
+    # Check the order both from the database and from the warm catalog cache
+    user_service.clear_catalog_cache()
+    for name, key in ORDERED_LISTINGS.items():
+        for source in ('database', 'cache'):
+            rows = getattr(user_service, name)()
+            if [key(row) for row in rows] != sorted(key(row) for row in rows):
+                failures.append((name, f'rows from the {source} are out of order', []))
+
+    missing = query_functions() - checked - SETUP_FUNCTIONS
+    for name in sorted(missing):
+        failures.append((name, 'not exercised by check_query_plans.py', []))
+
+    for name, statement, plan in failures:
+        print(f'FAIL {name}: {statement}')
+        for line in plan:
+            print(f'    {line}')
+    print(f'{len(checked)} functions checked, {len(failures)} problems')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,169 @@
+"""
+Per-request instrumentation: query count, SQL time, password hashing time, template
+render time and total latency, aggregated per endpoint into histograms that are
+rendered in the Prometheus text format.
+
+The request hooks in app.py call start_request() and finish_request(); user_service
+reports every statement through record_query() (and the time spent fetching its rows
+through record_fetch()) and every password hash through record_hash(); Flask's
+template signals call start_template() and finish_template(). Statements slower than SLOW_QUERY_MS, and requests that issue more
+than QUERY_COUNT_WARNING statements (usually a query inside a loop), are written to
+the slow query log.
+"""
+import logging
+import os
+import threading
+import time
+
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 100))
+QUERY_COUNT_WARNING = int(os.environ.get('QUERY_COUNT_WARNING', 50))
+SLOW_QUERY_LOG = os.environ.get('SLOW_QUERY_LOG', 'slow_queries.log')
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+_local = threading.local()
+_lock = threading.Lock()
+
+slow_log = logging.getLogger('pos.slow_queries')
+
+
+class Histogram:
+    """Cumulative histogram per endpoint, in the shape Prometheus expects"""
+
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, endpoint, value):
+        # Callers hold _lock
+        series = self._series.get(endpoint)
+        if series is None:
+            series = self._series[endpoint] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for endpoint, series in sorted(self._series.items()):
+            label = f'endpoint="{_escape(endpoint)}"'
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {series[-1]}')
+            lines.append(f'{self.name}_sum{{{label}}} {series[-2]}')
+            lines.append(f'{self.name}_count{{{label}}} {series[-1]}')
+        return lines
+
+
+request_seconds = Histogram('pos_request_duration_seconds', 'Time to handle a request.', LATENCY_BUCKETS)
+request_queries = Histogram('pos_request_sql_queries', 'SQL statements executed per request.', QUERY_COUNT_BUCKETS)
+request_sql_seconds = Histogram('pos_request_sql_seconds', 'Time spent in SQLite per request.', LATENCY_BUCKETS)
+request_hash_seconds = Histogram('pos_request_hash_seconds', 'Time spent waiting for password hashing per request.',
+                                 LATENCY_BUCKETS)
+request_template_seconds = Histogram('pos_request_template_seconds', 'Time spent rendering templates per request.',
+                                     LATENCY_BUCKETS)
+HISTOGRAMS = (request_seconds, request_queries, request_sql_seconds, request_hash_seconds, request_template_seconds)
+
+_responses = {}
+_slow_queries = 0
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _slow_logger():
+    """The slow query logger, writing to SLOW_QUERY_LOG once something is first logged"""
+    if not slow_log.handlers and SLOW_QUERY_LOG:
+        handler = logging.FileHandler(SLOW_QUERY_LOG)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        slow_log.addHandler(handler)
+        slow_log.setLevel(logging.INFO)
+        slow_log.propagate = False
+    return slow_log
+
+
+def start_request():
+    _local.current = {'started': time.perf_counter(), 'queries': 0, 'sql': 0.0, 'hash': 0.0, 'template': 0.0}
+
+
+def finish_request(endpoint, status):
+    """Record the current request under endpoint; does nothing outside start_request()"""
+    current = getattr(_local, 'current', None)
+    if current is None:
+        return
+    _local.current = None
+    endpoint = endpoint or 'unknown'
+    elapsed = time.perf_counter() - current['started']
+    with _lock:
+        request_seconds.observe(endpoint, elapsed)
+        request_queries.observe(endpoint, current['queries'])
+        request_sql_seconds.observe(endpoint, current['sql'])
+        request_hash_seconds.observe(endpoint, current['hash'])
+        request_template_seconds.observe(endpoint, current['template'])
+        key = (endpoint, status)
+        _responses[key] = _responses.get(key, 0) + 1
+    if current['queries'] > QUERY_COUNT_WARNING:
+        _slow_logger().warning('%d queries (%.1f ms of SQL) in one request to %s',
+                               current['queries'], current['sql'] * 1000, endpoint)
+
+
+def record_query(statement, seconds):
+    global _slow_queries
+    current = getattr(_local, 'current', None)
+    if current is not None:
+        current['queries'] += 1
+        current['sql'] += seconds
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        with _lock:
+            _slow_queries += 1
+        _slow_logger().warning('%.1f ms: %s', seconds * 1000, ' '.join(statement.split()))
+
+
+def record_fetch(seconds):
+    """Time spent stepping rows of a statement already counted by record_query"""
+    current = getattr(_local, 'current', None)
+    if current is not None:
+        current['sql'] += seconds
+
+
+def record_hash(seconds):
+    current = getattr(_local, 'current', None)
+    if current is not None:
+        current['hash'] += seconds
+
+
+def start_template():
+    current = getattr(_local, 'current', None)
+    if current is not None:
+        current['template_started'] = time.perf_counter()
+
+
+def finish_template():
+    current = getattr(_local, 'current', None)
+    if current is not None and 'template_started' in current:
+        current['template'] += time.perf_counter() - current.pop('template_started')
+
+
+def render(gauges=None):
+    """All metrics in the Prometheus text format; gauges maps extra metric names to values"""
+    with _lock:
+        lines = []
+        for histogram in HISTOGRAMS:
+            lines.extend(histogram.render())
+        lines.append('# HELP pos_responses_total Responses by endpoint and status code.')
+        lines.append('# TYPE pos_responses_total counter')
+        for (endpoint, status), count in sorted(_responses.items()):
+            lines.append(f'pos_responses_total{{endpoint="{_escape(endpoint)}",status="{status}"}} {count}')
+        lines.append('# HELP pos_slow_queries_total Statements slower than the slow query threshold.')
+        lines.append('# TYPE pos_slow_queries_total counter')
+        lines.append(f'pos_slow_queries_total {_slow_queries}')
+    for name, value in sorted((gauges or {}).items()):
+        lines.append(f'# TYPE {name} gauge')
+        lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
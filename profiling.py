@@ -0,0 +1,110 @@
+"""
+On-demand cProfile sampling of Flask views.
+
+While profiling is off the app's view functions are the undecorated originals, so it
+costs nothing. enable() swaps every view for a wrapper that profiles a sampled
+fraction of its calls (and every call to the chosen endpoints); disable() puts the
+originals back. Profiles are merged per endpoint and can be rendered as text or
+written out as pstats files. Settings and results are per process.
+"""
+import cProfile
+import io
+import os
+import pstats
+import random
+import threading
+from functools import wraps
+
+PROFILE_DIR = 'profiles'
+REPORT_LINES = 40
+
+_lock = threading.Lock()
+# Only one request is profiled at a time; others that are sampled meanwhile run normally
+_profiling = threading.Lock()
+_stats = {}
+_originals = {}
+settings = {'sample_rate': 0.0, 'endpoints': frozenset()}
+
+
+def is_enabled():
+    return bool(_originals)
+
+
+def enable(app, sample_rate=0.0, endpoints=(), exclude=()):
+    """Profile sample_rate (0 to 1) of all requests plus every request to endpoints"""
+    disable(app)
+    settings['sample_rate'] = sample_rate
+    settings['endpoints'] = frozenset(endpoints)
+    for endpoint, view in list(app.view_functions.items()):
+        if endpoint in exclude:
+            continue
+        _originals[endpoint] = view
+        app.view_functions[endpoint] = _sampled(endpoint, view)
+
+
+def disable(app):
+    for endpoint, view in _originals.items():
+        app.view_functions[endpoint] = view
+    _originals.clear()
+
+
+def _sampled(endpoint, view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if endpoint not in settings['endpoints'] and random.random() >= settings['sample_rate']:
+            return view(*args, **kwargs)
+        if not _profiling.acquire(blocking=False):
+            return view(*args, **kwargs)
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(view, *args, **kwargs)
+        finally:
+            _profiling.release()
+            _record(endpoint, profiler)
+    return wrapper
+
+
+def _record(endpoint, profiler):
+    with _lock:
+        entry = _stats.get(endpoint)
+        if entry is None:
+            _stats[endpoint] = [pstats.Stats(profiler), 1]
+        else:
+            entry[0].add(profiler)
+            entry[1] += 1
+
+
+def summary():
+    """(endpoint, profiled requests, total seconds) for every endpoint with a profile, slowest first"""
+    with _lock:
+        rows = [(endpoint, samples, stats.total_tt) for endpoint, (stats, samples) in _stats.items()]
+    return sorted(rows, key=lambda row: row[2], reverse=True)
+
+
+def report(endpoint, sort='cumulative', limit=REPORT_LINES):
+    """The endpoint's merged profile as pstats text, or None if it has not been profiled"""
+    output = io.StringIO()
+    with _lock:
+        entry = _stats.get(endpoint)
+        if entry is None:
+            return None
+        entry[0].stream = output
+        entry[0].sort_stats(sort).print_stats(limit)
+    return output.getvalue()
+
+
+def dump(endpoint):
+    """Write the endpoint's merged profile to PROFILE_DIR and return the file path, or None"""
+    with _lock:
+        entry = _stats.get(endpoint)
+        if entry is None:
+            return None
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.abspath(os.path.join(PROFILE_DIR, f'{endpoint}.pstats'))
+        entry[0].dump_stats(path)
+    return path
+
+
+def reset():
+    with _lock:
+        _stats.clear()
@@ -0,0 +1,11 @@
+"""
+Recompute the report rollup tables (sales_daily, sales_hourly, product_sales_daily
+and seller_sales_daily) from the full sales history.
+
+Usage: python rebuild_rollups.py
+"""
+import user_service
+
+user_service.init_db()
+user_service.rebuild_sales_rollups()
+print("Sales rollups rebuilt.")
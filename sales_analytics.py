@@ -0,0 +1,196 @@
+"""
+Vectorized sales analytics over sale_items joined to products and sales.
+
+Line items are streamed out of SQLite in chunks into NumPy column arrays, and
+every metric is computed with array operations rather than per-row Python loops.
+Summaries are cached per (start_date, end_date) window.
+
+Usage: python sales_analytics.py [start_date] [end_date]
+"""
+import json
+import sys
+from collections import namedtuple
+
+import numpy as np
+
+import user_service
+from cache import TTLCache
+
+CHUNK_SIZE = 100000
+ANALYTICS_TTL = 300
+MOVING_AVERAGE_DAYS = 7
+SECONDS_PER_DAY = 86400
+
+LineItems = namedtuple('LineItems', 'sale_id product_id quantity price timestamp')
+Catalog = namedtuple('Catalog', 'product_id sku name stock')
+
+_summaries = TTLCache(ANALYTICS_TTL, maxsize=32)
+
+
+def _window(start_date, end_date):
+    conditions = []
+    params = []
+    if start_date:
+        conditions.append('s.timestamp >= ?')
+        params.append(start_date)
+    if end_date:
+        conditions.append("s.timestamp < date(?, '+1 day')")
+        params.append(end_date)
+    return (f"WHERE {' AND '.join(conditions)}" if conditions else ''), params
+
+
+def load_line_items(start_date=None, end_date=None, chunk_size=CHUNK_SIZE):
+    """Load the line items of sales in the inclusive date range as columnar arrays"""
+    where, params = _window(start_date, end_date)
+    c = user_service.get_db().cursor()
+    c.execute(f'''SELECT si.sale_id, si.product_id, si.quantity, si.price, CAST(strftime('%s', s.timestamp) AS INTEGER)
+                  FROM sale_items si JOIN sales s ON s.id = si.sale_id
+                  {where}''', params)
+    chunks = []
+    while True:
+        rows = c.fetchmany(chunk_size)
+        if not rows:
+            break
+        chunks.append(np.array(rows, dtype=np.float64).reshape(-1, 5))
+    data = np.concatenate(chunks) if chunks else np.empty((0, 5))
+    return LineItems(
+        sale_id=data[:, 0].astype(np.int64),
+        product_id=data[:, 1].astype(np.int64),
+        quantity=data[:, 2].astype(np.int64),
+        price=data[:, 3],
+        timestamp=data[:, 4].astype(np.int64),
+    )
+
+
+def load_catalog():
+    """All products (including soft-deleted ones, which may still appear in old sales), sorted by id"""
+    c = user_service.get_db().cursor()
+    c.execute('SELECT id, sku, name, quantity FROM products ORDER BY id')
+    rows = c.fetchall()
+    return Catalog(
+        product_id=np.array([row[0] for row in rows], dtype=np.int64),
+        sku=np.array([row[1] for row in rows], dtype=object),
+        name=np.array([row[2] for row in rows], dtype=object),
+        stock=np.array([row[3] for row in rows], dtype=np.int64),
+    )
+
+
+def revenue(items):
+    return items.quantity * items.price
+
+
+def per_product(items):
+    """(product ids, units sold, revenue) aggregated per product"""
+    product_ids, index = np.unique(items.product_id, return_inverse=True)
+    units = np.bincount(index, weights=items.quantity, minlength=len(product_ids))
+    sales = np.bincount(index, weights=revenue(items), minlength=len(product_ids))
+    return product_ids, units.astype(np.int64), sales
+
+
+def top_sellers(items, n=10, by='revenue'):
+    """The n best selling product ids with their units and revenue, ranked by 'revenue' or 'units'"""
+    product_ids, units, sales = per_product(items)
+    key = sales if by == 'revenue' else units
+    order = np.argsort(-key, kind='stable')[:n]
+    return product_ids[order], units[order], sales[order]
+
+
+def _catalog_lookup(catalog, product_ids):
+    """Positions of product_ids in the catalog arrays and a mask of the ids that were found"""
+    if len(catalog.product_id) == 0:
+        return np.zeros(len(product_ids), np.int64), np.zeros(len(product_ids), bool)
+    position = np.clip(np.searchsorted(catalog.product_id, product_ids), 0, len(catalog.product_id) - 1)
+    return position, catalog.product_id[position] == product_ids
+
+
+def revenue_by_sku(items, catalog):
+    """Map of SKU -> revenue for every product sold ('#<id>' for products missing from the catalog)"""
+    product_ids, _, sales = per_product(items)
+    position, found = _catalog_lookup(catalog, product_ids)
+    return {(catalog.sku[i] if ok else f'#{pid}'): value
+            for i, ok, pid, value in zip(position.tolist(), found.tolist(), product_ids.tolist(), sales.tolist())}
+
+
+def basket_stats(items):
+    """Mean basket units and value, plus basket size weighted by basket value"""
+    if len(items.sale_id) == 0:
+        return {'baskets': 0, 'mean_units': 0.0, 'mean_value': 0.0, 'price_weighted_units': 0.0}
+    _, index = np.unique(items.sale_id, return_inverse=True)
+    units = np.bincount(index, weights=items.quantity)
+    value = np.bincount(index, weights=revenue(items))
+    weighted = float(np.average(units, weights=value)) if value.sum() > 0 else float(units.mean())
+    return {
+        'baskets': int(len(units)),
+        'mean_units': float(units.mean()),
+        'mean_value': float(value.mean()),
+        'price_weighted_units': weighted,
+    }
+
+
+def daily_revenue(items):
+    """(first day as epoch seconds, revenue per day) covering every day from the first to the last sale"""
+    if len(items.timestamp) == 0:
+        return 0, np.zeros(0)
+    days = items.timestamp // SECONDS_PER_DAY
+    first = days.min()
+    return int(first * SECONDS_PER_DAY), np.bincount(days - first, weights=revenue(items))
+
+
+def moving_average(series, window=MOVING_AVERAGE_DAYS):
+    """Trailing moving average; the first window - 1 points average over what is available"""
+    cumulative = np.concatenate(([0.0], np.cumsum(series)))
+    end = np.arange(1, len(series) + 1)
+    start = np.maximum(end - window, 0)
+    return (cumulative[end] - cumulative[start]) / (end - start)
+
+
+def inventory_turnover(items, catalog):
+    """
+    Units sold divided by average inventory per product over the window. Only the
+    current stock is recorded, so the opening stock is estimated as current stock plus
+    units sold (no restocks) and the average as the midpoint of opening and current.
+    """
+    product_ids, units, _ = per_product(items)
+    position, found = _catalog_lookup(catalog, product_ids)
+    stock = np.where(found, catalog.stock[position] if len(catalog.stock) else 0, 0)
+    average_inventory = stock + units / 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        turnover = np.where(average_inventory > 0, units / average_inventory, 0.0)
+    return product_ids, turnover
+
+
+def sales_summary(start_date=None, end_date=None, top=10):
+    """All metrics for a date window as plain Python values, cached for ANALYTICS_TTL seconds"""
+    key = (start_date, end_date, top)
+    summary = _summaries.get(key)
+    if summary is not None:
+        return summary
+
+    items = load_line_items(start_date, end_date)
+    catalog = load_catalog()
+    names = dict(zip(catalog.product_id.tolist(), catalog.name.tolist()))
+    product_ids, units, sales = top_sellers(items, top)
+    first_day, daily = daily_revenue(items)
+    turnover_ids, turnover = inventory_turnover(items, catalog)
+    summary = {
+        'start_date': start_date,
+        'end_date': end_date,
+        'line_items': int(len(items.sale_id)),
+        'revenue': float(revenue(items).sum()),
+        'units': int(items.quantity.sum()),
+        'top_sellers': [{'product_id': int(pid), 'name': names.get(int(pid)), 'units': int(u), 'revenue': float(r)}
+                        for pid, u, r in zip(product_ids, units, sales)],
+        'revenue_by_sku': revenue_by_sku(items, catalog),
+        'basket': basket_stats(items),
+        'daily_revenue_start': first_day,
+        'daily_revenue': daily.tolist(),
+        'daily_revenue_moving_average': moving_average(daily).tolist(),
+        'inventory_turnover': {int(pid): float(t) for pid, t in zip(turnover_ids, turnover)},
+    }
+    _summaries.set(key, summary)
+    return summary
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:] + [None, None]
+    print(json.dumps(sales_summary(args[0], args[1]), indent=2))
@@ -1,15 +1,201 @@
 import sqlite3
+import math
+import multiprocessing
 import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
 from passlib.hash import scrypt
 from werkzeug.security import generate_password_hash, check_password_hash
+from cache import TTLCache
+import metrics
 
 DATABASE = 'users.db'
 
-def migrate_db():
-    conn = sqlite3.connect(DATABASE)
-    c = conn.cursor()
-    
-    # Check if users table has role column
+# Connection pool settings
+POOL_SIZE = 8
+BUSY_TIMEOUT_MS = 5000
+CACHE_SIZE_KB = 16384
+MMAP_SIZE = 64 * 1024 * 1024
+
+# Secondary indexes created by init_db. check_query_plans.py fails if a hot query
+# stops using them, so add new ones here rather than creating them by hand.
+INDEXES = [
+    'CREATE INDEX IF NOT EXISTS idx_users_email_nocase ON users(email COLLATE NOCASE)',
+    'CREATE INDEX IF NOT EXISTS idx_users_last_name ON users(last_name COLLATE NOCASE)',
+    'CREATE INDEX IF NOT EXISTS idx_users_role_email ON users(role, email COLLATE NOCASE)',
+    'CREATE INDEX IF NOT EXISTS idx_users_role_last_name ON users(role, last_name COLLATE NOCASE)',
+    'CREATE INDEX IF NOT EXISTS idx_products_live ON products(quantity) WHERE is_deleted = 0',
+    'CREATE INDEX IF NOT EXISTS idx_sales_timestamp ON sales(timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_sales_customer_email ON sales(customer_email, timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_sales_customer_id ON sales(customer_id, timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_sale_items_sale_id ON sale_items(sale_id)',
+]
+
+# Product catalog cache: ('id', id) -> row, ('sku', sku) -> id and 'all' -> ids of live
+# products in id order. Product writes refresh or drop the affected entries; checkout
+# always reads stock from the database.
+CATALOG_TTL = 30
+CATALOG_MAX_PRODUCTS = 100000
+
+# Two entries per product (by id and by SKU) plus the 'all' listing
+_catalog = TTLCache(CATALOG_TTL, 2 * CATALOG_MAX_PRODUCTS + 1)
+
+# Principal cache: user id -> (id, first_name, last_name, email, role) for the access
+# checks made on every request. User writes drop their entry; the TTL bounds how long
+# a change made outside user_service can go unnoticed.
+PRINCIPAL_TTL = 60
+PRINCIPAL_CACHE_SIZE = 10000
+
+_principals = TTLCache(PRINCIPAL_TTL, PRINCIPAL_CACHE_SIZE)
+
+# Bumped after any write that can rename a product or change its SKU, so anything
+# rendered from product names (such as receipts) can tell it is out of date
+_product_names_version = 0
+_product_names_lock = threading.Lock()
+
+# Triggers log every product and user change to cache_changes so each worker process
+# can drop exactly the entries other processes changed (see sync_caches). The log
+# keeps the newest CACHE_CHANGES_KEEP rows; a worker that falls further behind
+# clears its caches instead.
+CACHE_CHANGES_KEEP = 10000
+
+_last_change_id = None
+_changes_lock = threading.Lock()
+
+# Bulk imports commit this many rows per transaction; exports fetch this many per round trip
+IMPORT_BATCH_SIZE = 1000
+EXPORT_CHUNK_SIZE = 1000
+
+# Bulk user imports hash passwords on their own process pool, leaving the request-path
+# hashing threads to logins and sign-ups. Batches stay under SQLite's old 999 parameter limit.
+USER_IMPORT_BATCH_SIZE = 500
+USER_IMPORT_PROCESSES = max(1, (os.cpu_count() or 2) - 1)
+USER_ROLES = ('admin', 'seller', 'customer')
+
+# scrypt is CPU- and memory-hard, so it runs on a few dedicated threads. At most
+# HASH_QUEUE_SIZE callers wait for a thread; anyone beyond that gets HashQueueFull.
+HASH_WORKERS = 2
+HASH_QUEUE_SIZE = 16
+
+_hash_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix='scrypt')
+_hash_slots = threading.BoundedSemaphore(HASH_WORKERS + HASH_QUEUE_SIZE)
+_hash_stats_lock = threading.Lock()
+_hash_stats = {'in_flight': 0, 'completed': 0, 'rejected': 0,
+               'wait_seconds_total': 0.0, 'hash_seconds_total': 0.0, 'hash_seconds_max': 0.0}
+_pool = queue.LifoQueue(maxsize=POOL_SIZE)
+_local = threading.local()
+
+# Optional group commit (see start_group_commit): one writer thread sells every cart
+# queued within GROUP_COMMIT_WINDOW_MS, at most GROUP_COMMIT_MAX_OPS of them, in a
+# single transaction, so concurrent checkouts share one write lock and one WAL sync
+GROUP_COMMIT_WINDOW_MS = 2
+GROUP_COMMIT_MAX_OPS = 64
+# Seconds a checkout waits for the writer before giving up
+GROUP_COMMIT_TIMEOUT = 30
+
+_checkouts = None
+_writer = None
+_writer_lock = threading.Lock()
+_group_stats = {'batches': 0, 'checkouts': 0, 'failed_batches': 0, 'largest_batch': 0}
+
+class _TimedCursor(sqlite3.Cursor):
+    """Cursor that reports each statement's execute and fetch time to metrics"""
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            metrics.record_query(sql, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            metrics.record_query(sql, time.perf_counter() - started)
+
+    def _timed_fetch(self, fetch, *args):
+        started = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            # Fetch time belongs to the statement already counted by execute
+            metrics.record_fetch(time.perf_counter() - started)
+
+    def fetchone(self):
+        return self._timed_fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed_fetch(super().fetchmany, size if size is not None else self.arraysize)
+
+    def fetchall(self):
+        return self._timed_fetch(super().fetchall)
+
+class _TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=_TimedCursor):
+        return super().cursor(factory)
+
+def _connect():
+    """Open a new connection with the pragmas shared by every pooled connection"""
+    conn = sqlite3.connect(DATABASE, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+                           factory=_TimedConnection)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA cache_size=-{CACHE_SIZE_KB}')
+    conn.execute(f'PRAGMA mmap_size={MMAP_SIZE}')
+    conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+    return conn
+
+def get_db():
+    """Return the connection bound to the current thread, checking one out of the pool if needed"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        try:
+            conn = _pool.get_nowait()
+        except queue.Empty:
+            conn = _connect()
+        _local.conn = conn
+    return conn
+
+def release_db(exception=None):
+    """Return the current thread's connection to the pool (registered as a Flask teardown hook)"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        return
+    _local.conn = None
+    # Never hand out a connection with a half-finished write still open
+    if conn.in_transaction:
+        conn.rollback()
+    try:
+        _pool.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+def _drop_db():
+    """Close the current thread's connection instead of returning it to the pool"""
+    conn = getattr(_local, 'conn', None)
+    _local.conn = None
+    if conn is not None:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+def close_pool():
+    """Close every pooled connection, e.g. after pointing DATABASE at another file"""
+    release_db()
+    while True:
+        try:
+            _pool.get_nowait().close()
+        except queue.Empty:
+            break
+
+def _add_role_and_lockout_columns(c):
+    """Bring databases created before roles, lockout and customer receipts up to the current columns"""
     c.execute("PRAGMA table_info(users)")
     columns = [col[1] for col in c.fetchall()]
     
@@ -22,18 +208,18 @@ def migrate_db():
     if 'is_locked' not in columns:
         c.execute('ALTER TABLE users ADD COLUMN is_locked INTEGER DEFAULT 0')
     
-    # Update existing users to have proper roles
-    c.execute('UPDATE users SET role = "admin" WHERE is_admin = 1')
-    c.execute('UPDATE users SET role = "seller" WHERE is_admin = 0 AND is_approved = 1')
-    c.execute('UPDATE users SET role = "customer" WHERE is_admin = 0 AND is_approved = 0')
+    # Map the old is_admin/is_approved flags onto roles (only legacy databases have them)
+    if 'is_admin' in columns:
+        c.execute('UPDATE users SET role = "admin" WHERE is_admin = 1')
+        c.execute('UPDATE users SET role = "seller" WHERE is_admin = 0 AND is_approved = 1')
+        c.execute('UPDATE users SET role = "customer" WHERE is_admin = 0 AND is_approved = 0')
     
-    # Check if products table has is_deleted column
     c.execute("PRAGMA table_info(products)")
     product_columns = [col[1] for col in c.fetchall()]
     if 'is_deleted' not in product_columns:
         c.execute('ALTER TABLE products ADD COLUMN is_deleted INTEGER DEFAULT 0')
     
-    # Add customer_name to sales table for receipts
+    # Add customer details to sales table for receipts
     c.execute("PRAGMA table_info(sales)")
     sales_columns = [col[1] for col in c.fetchall()]
     if 'customer_name' not in sales_columns:
@@ -43,23 +229,207 @@ def migrate_db():
     if 'created_by' not in sales_columns:
         c.execute('ALTER TABLE sales ADD COLUMN created_by INTEGER')
     
-    # Check if there's an old 'product' table and migrate data if needed
+    # Move rows from the old 'product' table into 'products'
     c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='product'")
     if c.fetchone():
-        # Migrate data from old 'product' table to 'products' table
-        c.execute("SELECT id, name, sku, quantity, price, is_deleted FROM product")
-        old_products = c.fetchall()
-        for product in old_products:
-            c.execute('''INSERT OR IGNORE INTO products (id, name, sku, quantity, price, is_deleted) 
-                         VALUES (?, ?, ?, ?, ?, ?)''', product)
-        # Drop the old table
+        c.execute('''INSERT OR IGNORE INTO products (id, name, sku, quantity, price, is_deleted)
+                     SELECT id, name, sku, quantity, price, is_deleted FROM product''')
         c.execute("DROP TABLE product")
+
+def _create_stats_counters(c):
+    """
+    Create the dashboard_stats counter rows and the triggers that keep them current,
+    so dashboards read a handful of rows instead of counting whole tables.
+    """
+    c.execute('''CREATE TABLE IF NOT EXISTS dashboard_stats (
+        name TEXT PRIMARY KEY,
+        value NOT NULL DEFAULT 0
+    )''')
+
+    triggers = [
+        '''CREATE TRIGGER IF NOT EXISTS stats_users_insert AFTER INSERT ON users BEGIN
+            UPDATE dashboard_stats SET value = value + 1 WHERE name = 'user_count';
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS stats_users_delete AFTER DELETE ON users BEGIN
+            UPDATE dashboard_stats SET value = value - 1 WHERE name = 'user_count';
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS stats_products_insert AFTER INSERT ON products WHEN NEW.is_deleted = 0 BEGIN
+            UPDATE dashboard_stats SET value = value + 1 WHERE name = 'product_count';
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS stats_products_soft_delete AFTER UPDATE OF is_deleted ON products
+        WHEN OLD.is_deleted IS NOT NEW.is_deleted BEGIN
+            UPDATE dashboard_stats SET value = value + (CASE WHEN NEW.is_deleted = 0 THEN 1 ELSE -1 END)
+            WHERE name = 'product_count';
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS stats_products_delete AFTER DELETE ON products WHEN OLD.is_deleted = 0 BEGIN
+            UPDATE dashboard_stats SET value = value - 1 WHERE name = 'product_count';
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS stats_sales_insert AFTER INSERT ON sales BEGIN
+            UPDATE dashboard_stats SET value = value + 1 WHERE name = 'sales_count';
+            UPDATE dashboard_stats SET value = value + NEW.total WHERE name = 'total_revenue';
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS stats_sales_update AFTER UPDATE OF total ON sales BEGIN
+            UPDATE dashboard_stats SET value = value - OLD.total + NEW.total WHERE name = 'total_revenue';
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS stats_sales_delete AFTER DELETE ON sales BEGIN
+            UPDATE dashboard_stats SET value = value - 1 WHERE name = 'sales_count';
+            UPDATE dashboard_stats SET value = value - OLD.total WHERE name = 'total_revenue';
+        END''',
+    ]
+    for trigger in triggers:
+        c.execute(trigger)
+
+    # Seed the counters from the existing tables
+    c.execute('''INSERT OR IGNORE INTO dashboard_stats (name, value)
+                 SELECT 'user_count', COUNT(*) FROM users
+                 UNION ALL SELECT 'product_count', COUNT(*) FROM products WHERE is_deleted = 0
+                 UNION ALL SELECT 'sales_count', COUNT(*) FROM sales
+                 UNION ALL SELECT 'total_revenue', COALESCE(SUM(total), 0) FROM sales''')
+
+def _add_sales_customer_id(c):
+    """Link sales to the buying customer by id and backfill it from customer_email"""
+    c.execute("PRAGMA table_info(sales)")
+    sales_columns = [col[1] for col in c.fetchall()]
+    if 'customer_id' not in sales_columns:
+        c.execute('ALTER TABLE sales ADD COLUMN customer_id INTEGER REFERENCES users(id)')
+    c.execute('''UPDATE sales SET customer_id = (SELECT id FROM users WHERE users.email = sales.customer_email)
+                 WHERE customer_id IS NULL AND customer_email IS NOT NULL''')
+
+def _create_sales_rollups(c):
+    """Create the report rollup tables and fill them from the existing sales"""
+    c.execute('''CREATE TABLE IF NOT EXISTS sales_daily (
+        day TEXT PRIMARY KEY,
+        sales_count INTEGER NOT NULL DEFAULT 0,
+        revenue REAL NOT NULL DEFAULT 0,
+        units INTEGER NOT NULL DEFAULT 0
+    )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS sales_hourly (
+        hour TEXT PRIMARY KEY,
+        sales_count INTEGER NOT NULL DEFAULT 0,
+        revenue REAL NOT NULL DEFAULT 0,
+        units INTEGER NOT NULL DEFAULT 0
+    )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS product_sales_daily (
+        day TEXT NOT NULL,
+        product_id INTEGER NOT NULL,
+        units INTEGER NOT NULL DEFAULT 0,
+        revenue REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, product_id)
+    )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS seller_sales_daily (
+        day TEXT NOT NULL,
+        created_by INTEGER NOT NULL,
+        sales_count INTEGER NOT NULL DEFAULT 0,
+        revenue REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, created_by)
+    )''')
+    _rebuild_sales_rollups(c)
+
+def _create_product_search(c):
+    """Full-text index over product name and SKU, kept in sync with products by triggers"""
+    c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+        name, sku, content='products', content_rowid='id', prefix='2 3'
+    )''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts (rowid, name, sku) VALUES (NEW.id, NEW.name, NEW.sku);
+    END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts (products_fts, rowid, name, sku) VALUES ('delete', OLD.id, OLD.name, OLD.sku);
+    END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE OF name, sku ON products BEGIN
+        INSERT INTO products_fts (products_fts, rowid, name, sku) VALUES ('delete', OLD.id, OLD.name, OLD.sku);
+        INSERT INTO products_fts (rowid, name, sku) VALUES (NEW.id, NEW.name, NEW.sku);
+    END''')
+    c.execute("INSERT INTO products_fts (products_fts) VALUES ('rebuild')")
+
+def _create_cache_changes(c):
+    """Change log read by sync_caches, filled by triggers so every write path is covered"""
+    c.execute('''CREATE TABLE IF NOT EXISTS cache_changes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        entity TEXT NOT NULL,
+        key INTEGER
+    )''')
+    triggers = [
+        f'''CREATE TRIGGER IF NOT EXISTS cache_changes_prune AFTER INSERT ON cache_changes BEGIN
+            DELETE FROM cache_changes WHERE id <= NEW.id - {CACHE_CHANGES_KEEP};
+        END''',
+        # 'catalog' changes add or remove a live product, 'product' changes any column
+        # of one and 'product_name' its name or SKU
+        '''CREATE TRIGGER IF NOT EXISTS products_cache_insert AFTER INSERT ON products BEGIN
+            INSERT INTO cache_changes (entity, key) VALUES ('catalog', NEW.id);
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS products_cache_update AFTER UPDATE ON products BEGIN
+            INSERT INTO cache_changes (entity, key) VALUES ('product', NEW.id);
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS products_cache_membership AFTER UPDATE OF is_deleted ON products
+        WHEN OLD.is_deleted IS NOT NEW.is_deleted BEGIN
+            INSERT INTO cache_changes (entity, key) VALUES ('catalog', NEW.id);
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS products_cache_rename AFTER UPDATE OF name, sku ON products
+        WHEN OLD.name IS NOT NEW.name OR OLD.sku IS NOT NEW.sku BEGIN
+            INSERT INTO cache_changes (entity, key) VALUES ('product_name', NEW.id);
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS products_cache_delete AFTER DELETE ON products BEGIN
+            INSERT INTO cache_changes (entity, key) VALUES ('catalog', OLD.id);
+        END''',
+        # Failed-login counters change constantly and are never cached, so they are not logged
+        '''CREATE TRIGGER IF NOT EXISTS users_cache_update
+        AFTER UPDATE OF first_name, middle_name, last_name, email, role, is_locked ON users BEGIN
+            INSERT INTO cache_changes (entity, key) VALUES ('user', NEW.id);
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS users_cache_delete AFTER DELETE ON users BEGIN
+            INSERT INTO cache_changes (entity, key) VALUES ('user', OLD.id);
+        END''',
+    ]
+    for trigger in triggers:
+        c.execute(trigger)
+
+def _drop_users_role_index(c):
+    """idx_users_role_email and idx_users_role_last_name both lead with role, so the plain role index only slows writes"""
+    c.execute('DROP INDEX IF EXISTS idx_users_role')
+
+# Schema migrations as (version, function). Each one runs exactly once, in its own
+# transaction, and is recorded in schema_version. Append new steps; never renumber.
+MIGRATIONS = [
+    (1, _add_role_and_lockout_columns),
+    (2, _create_stats_counters),
+    (3, _add_sales_customer_id),
+    (4, _create_sales_rollups),
+    (5, _create_product_search),
+    (6, _create_cache_changes),
+    (7, _drop_users_role_index),
+]
+
+def migrate_db():
+    """Apply every migration newer than the database's schema_version"""
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )''')
+    c.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version')
+    current = c.fetchone()[0]
     
-    conn.commit()
-    conn.close()
+    for version, migration in MIGRATIONS:
+        if version <= current:
+            continue
+        c.execute('BEGIN IMMEDIATE')
+        try:
+            # Another worker may have applied it while we waited for the write lock
+            c.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version')
+            if c.fetchone()[0] >= version:
+                conn.rollback()
+                continue
+            migration(c)
+            c.execute('INSERT INTO schema_version (version) VALUES (?)', (version,))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
 
 def init_db():
-    conn = sqlite3.connect(DATABASE)
+    conn = get_db()
     c = conn.cursor()
     
     # Create users table with proper roles
@@ -101,7 +471,9 @@ def init_db():
         customer_email TEXT,
         total REAL NOT NULL,
         created_by INTEGER,
-        FOREIGN KEY (created_by) REFERENCES users(id)
+        customer_id INTEGER,
+        FOREIGN KEY (created_by) REFERENCES users(id),
+        FOREIGN KEY (customer_id) REFERENCES users(id)
     )''')
 
     # Create sale_items table
@@ -116,18 +488,26 @@ def init_db():
     )''')
 
     conn.commit()
-    conn.close()
     migrate_db()
+    create_indexes()
     
     # Create default admin user if no users exist
     create_default_admin()
 
+def create_indexes():
+    """Create every index in INDEXES that does not exist yet"""
+    conn = get_db()
+    c = conn.cursor()
+    for statement in INDEXES:
+        c.execute(statement)
+    conn.commit()
+
 def create_default_admin():
     """Create a default admin user if no users exist"""
-    conn = sqlite3.connect(DATABASE)
+    conn = get_db()
     c = conn.cursor()
-    c.execute('SELECT COUNT(*) FROM users')
-    if c.fetchone()[0] == 0:
+    c.execute('SELECT 1 FROM users LIMIT 1')
+    if c.fetchone() is None:
         # Create default admin with scrypt password
         password = "admin123"
         hashed_password = hash_password_scrypt(password)
@@ -136,117 +516,349 @@ def create_default_admin():
                      VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
                   ('Admin', '', 'User', '1990-01-01', 30, 'Admin Address', 'admin@pos.com', hashed_password, 'admin'))
         conn.commit()
-    conn.close()
 
-def hash_password_scrypt(password):
-    """Hash password using scrypt from passlib"""
-    return scrypt.hash(password)
+class HashQueueFull(Exception):
+    """Raised when the password hashing queue is full; the caller should retry later"""
 
-def verify_password_scrypt(password, hashed_password):
-    """Verify password using scrypt from passlib"""
+def _timed_hash(fn, args, queued_at):
+    started = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        finished = time.perf_counter()
+        with _hash_stats_lock:
+            _hash_stats['completed'] += 1
+            _hash_stats['wait_seconds_total'] += started - queued_at
+            _hash_stats['hash_seconds_total'] += finished - started
+            _hash_stats['hash_seconds_max'] = max(_hash_stats['hash_seconds_max'], finished - started)
+
+def _run_on_hash_pool(fn, *args):
+    """Run fn on the hashing pool and wait for it, or raise HashQueueFull without waiting"""
+    if not _hash_slots.acquire(blocking=False):
+        with _hash_stats_lock:
+            _hash_stats['rejected'] += 1
+        raise HashQueueFull('Too many sign-in requests right now. Please try again in a moment.')
+    with _hash_stats_lock:
+        _hash_stats['in_flight'] += 1
+    queued_at = time.perf_counter()
+    try:
+        return _hash_executor.submit(_timed_hash, fn, args, queued_at).result()
+    finally:
+        metrics.record_hash(time.perf_counter() - queued_at)
+        with _hash_stats_lock:
+            _hash_stats['in_flight'] -= 1
+        _hash_slots.release()
+
+def get_hash_pool_stats():
+    """Snapshot of the hashing pool: queue depth, rejections and hash/wait latency totals"""
+    with _hash_stats_lock:
+        stats = dict(_hash_stats)
+    stats['queue_depth'] = max(0, stats['in_flight'] - HASH_WORKERS)
+    return stats
+
+def _verify_scrypt(password, hashed_password):
     try:
         return scrypt.verify(password, hashed_password)
     except:
         return False
 
+def hash_password_scrypt(password):
+    """Hash password using scrypt from passlib (on the hashing pool)"""
+    return _run_on_hash_pool(scrypt.hash, password)
+
+def verify_password_scrypt(password, hashed_password):
+    """Verify password using scrypt from passlib (on the hashing pool)"""
+    return _run_on_hash_pool(_verify_scrypt, password, hashed_password)
+
+def _hash_password(password):
+    # Module-level so the import process pool can pickle it
+    return scrypt.hash(password)
+
+def _user_from_record(record):
+    """Column values for an imported user, password still in clear text; raises ValueError saying what is wrong"""
+    if record is None:
+        raise ValueError('Could not parse line.')
+    values = {key: str(record.get(key) or '').strip()
+              for key in ('first_name', 'middle_name', 'last_name', 'birthday', 'age', 'address', 'email', 'role')}
+    password = str(record.get('password') or '')
+    missing = [key for key in ('first_name', 'last_name', 'birthday', 'age', 'address', 'email') if not values[key]]
+    if missing or not password:
+        raise ValueError(f"Missing {', '.join(missing + ([] if password else ['password']))}.")
+    if '@' not in values['email']:
+        raise ValueError('Invalid email.')
+    try:
+        datetime.strptime(values['birthday'], '%Y-%m-%d')
+    except ValueError:
+        raise ValueError('Birthday must be YYYY-MM-DD.')
+    try:
+        age = int(values['age'])
+    except ValueError:
+        raise ValueError('Invalid age.')
+    role = values['role'] or 'customer'
+    if role not in USER_ROLES:
+        raise ValueError(f'Unknown role {role}.')
+    return (values['first_name'], values['middle_name'], values['last_name'], values['birthday'], age,
+            values['address'], values['email'], password, role)
+
+def _insert_users(conn, pool, batch):
+    """Hash and insert a batch of (line number, user) pairs in one transaction; returns (inserted, [(line, error)])"""
+    # Hash the whole batch before taking the write lock; map() is lazy, so consuming it
+    # inside the transaction would hold the lock for every scrypt round
+    hashes = list(pool.map(_hash_password, [user[7] for _, user in batch], chunksize=8))
+    c = conn.cursor()
+    c.execute('BEGIN IMMEDIATE')
+    inserted = 0
+    errors = []
+    try:
+        for (line_number, user), hashed_password in zip(batch, hashes):
+            c.execute('''INSERT INTO users (first_name, middle_name, last_name, birthday, age, address, email, password, role)
+                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (email) DO NOTHING''',
+                      user[:7] + (hashed_password, user[8]))
+            if c.rowcount:
+                inserted += 1
+            else:
+                # Registered since the batch was checked
+                errors.append((line_number, f'Email {user[6]} is already registered.'))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return inserted, errors
+
+def import_users(records, batch_size=USER_IMPORT_BATCH_SIZE, processes=USER_IMPORT_PROCESSES):
+    """
+    Create users from (line number, record) pairs, one transaction per batch_size rows.
+
+    Rows with missing or invalid fields and emails that are already registered (or
+    repeated in the file) are reported and skipped without failing the rest of the
+    batch, and before any time is spent hashing them. Passwords are hashed across
+    processes worker processes. Returns (users created, [(line number, error)]).
+    """
+    conn = get_db()
+    c = conn.cursor()
+    imported = 0
+    errors = []
+    seen = set()
+    pending = []
+
+    def flush(pool):
+        nonlocal imported, pending
+        emails = [user[6] for _, user in pending]
+        placeholders = ','.join('?' * len(emails))
+        c.execute(f'SELECT email FROM users WHERE email IN ({placeholders})', emails)
+        registered = {row[0] for row in c.fetchall()}
+        batch = []
+        for line_number, user in pending:
+            if user[6] in registered:
+                errors.append((line_number, f'Email {user[6]} is already registered.'))
+            else:
+                batch.append((line_number, user))
+        pending = []
+        if batch:
+            inserted, batch_errors = _insert_users(conn, pool, batch)
+            imported += inserted
+            errors.extend(batch_errors)
+
+    # Spawned workers do not inherit this process's threads, locks or open connections; they
+    # re-import the entry script, so its startup code must sit under if __name__ == '__main__'
+    with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('spawn')) as pool:
+        for line_number, record in records:
+            try:
+                user = _user_from_record(record)
+            except ValueError as e:
+                errors.append((line_number, str(e)))
+                continue
+            if user[6] in seen:
+                errors.append((line_number, f'Email {user[6]} appears earlier in the file.'))
+                continue
+            seen.add(user[6])
+            pending.append((line_number, user))
+            if len(pending) >= batch_size:
+                flush(pool)
+        if pending:
+            flush(pool)
+    errors.sort()
+    return imported, errors
+
 def create_user(first_name, middle_name, last_name, birthday, age, address, email, password, role='customer'):
-    conn = sqlite3.connect(DATABASE)
+    conn = get_db()
     c = conn.cursor()
     hashed_password = hash_password_scrypt(password)
     c.execute('''INSERT INTO users (first_name, middle_name, last_name, birthday, age, address, email, password, role)
                  VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
               (first_name, middle_name, last_name, birthday, age, address, email, hashed_password, role))
     conn.commit()
-    conn.close()
 
 def get_user_by_email(email):
-    conn = sqlite3.connect(DATABASE)
+    conn = get_db()
     c = conn.cursor()
     c.execute('SELECT * FROM users WHERE email = ?', (email,))
     user = c.fetchone()
-    conn.close()
     return user
 
 def get_all_users():
-    conn = sqlite3.connect(DATABASE)
+    conn = get_db()
     c = conn.cursor()
     c.execute('SELECT id, first_name, middle_name, last_name, birthday, age, address, email, role, is_locked FROM users')
     users = c.fetchall()
-    conn.close()
     return users
 
+# Columns that get_users_page can prefix-search, each backed by NOCASE indexes with and without role
+USER_SEARCH_FIELDS = ('last_name', 'email')
+
+def get_users_page(cursor=None, limit=50, role=None, search=None, search_by='last_name'):
+    """
+    Return one page of users and the cursor for the next page (None on the last page).
+
+    Without search, users are listed by id. With search, only users whose search_by
+    column (last_name or email) starts with it, ignoring case, are listed in that
+    column's order. Either way pages are keyed on the last row rather than OFFSET.
+    """
+    if search_by not in USER_SEARCH_FIELDS:
+        raise ValueError(f'Cannot search users by {search_by}')
+    conditions = []
+    params = []
+    if role:
+        # Listed by id, a role page walks the primary key and filters as it goes; the
+        # unary + keeps the planner from reading a role index and sorting it by id
+        conditions.append('role = ?' if search else '+role = ?')
+        params.append(role)
+    if search:
+        # Every string with this prefix sorts between the prefix and the prefix plus the highest code point
+        conditions.append(f'{search_by} >= ? COLLATE NOCASE AND {search_by} < ? COLLATE NOCASE')
+        params.extend([search, search + chr(0x10FFFF)])
+        order = f'{search_by} COLLATE NOCASE, id'
+        if cursor:
+            key, user_id = decode_users_cursor(cursor)
+            conditions.append(f'({search_by} COLLATE NOCASE, id) > (?, ?)')
+            params.extend([key, user_id])
+    else:
+        order = 'id'
+        conditions.append('id > ?')
+        params.append(decode_users_cursor(cursor)[1] if cursor else 0)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+    conn = get_db()
+    c = conn.cursor()
+    c.execute(f'''SELECT id, first_name, middle_name, last_name, birthday, age, address, email, role, is_locked
+                  FROM users {where} ORDER BY {order} LIMIT ?''', params + [limit + 1])
+    users = c.fetchall()
+
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        last = users[-1]
+        key = (last[7] if search_by == 'email' else last[3]) if search else ''
+        next_cursor = encode_users_cursor(key, last[0])
+    return users, next_cursor
+
+def encode_users_cursor(key, user_id):
+    return f'{key}|{user_id}'
+
+def decode_users_cursor(cursor):
+    """Split a cursor from encode_users_cursor; raises ValueError if it is malformed"""
+    key, user_id = cursor.rsplit('|', 1)
+    return key, int(user_id)
+
 def get_user_by_id(user_id):
-    conn = sqlite3.connect(DATABASE)
+    conn = get_db()
     c = conn.cursor()
     c.execute('SELECT id, first_name, middle_name, last_name, birthday, age, address, email, role FROM users WHERE id=?', (user_id,))
     user = c.fetchone()
-    conn.close()
     return user
 
+def get_principal(user_id):
+    """(id, first_name, last_name, email, role) of a user for access checks, or None if the user is gone"""
+    principal = _principals.get(user_id)
+    if principal is not None:
+        return principal
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('SELECT id, first_name, last_name, email, role FROM users WHERE id=?', (user_id,))
+    principal = c.fetchone()
+    if principal is not None:
+        _principals.set(user_id, principal)
+    return principal
+
+def invalidate_principal(user_id):
+    _principals.discard(user_id)
+
 def update_user(user_id, first_name, middle_name, last_name, birthday, age, address, email, role):
-    conn = sqlite3.connect(DATABASE)
+    conn = get_db()
     c = conn.cursor()
     c.execute('''UPDATE users SET first_name=?, middle_name=?, last_name=?, birthday=?, age=?, address=?, email=?, role=? WHERE id=?''',
               (first_name, middle_name, last_name, birthday, age, address, email, role, user_id))
     conn.commit()
-    conn.close()
+    invalidate_principal(user_id)
 
 def delete_user(user_id):
-    conn = sqlite3.connect(DATABASE)
+    conn = get_db()
     c = conn.cursor()
     c.execute('DELETE FROM users WHERE id=?', (user_id,))
     conn.commit()
-    conn.close()
+    invalidate_principal(user_id)
 
 def set_user_role(user_id, role):
-    conn = sqlite3.connect(DATABASE)
+    conn = get_db()
     c = conn.cursor()
     c.execute('UPDATE users SET role=? WHERE id=?', (role, user_id))
     conn.commit()
-    conn.close()
+    invalidate_principal(user_id)
 
 def increment_login_attempts(email):
-    conn = sqlite3.connect(DATABASE)
+    conn = get_db()
     c = conn.cursor()
     c.execute('UPDATE users SET login_attempts = login_attempts + 1, last_login_attempt = CURRENT_TIMESTAMP WHERE email = ?', (email,))
     conn.commit()
-    conn.close()
 
 def reset_login_attempts(email):
-    conn = sqlite3.connect(DATABASE)
+    conn = get_db()
     c = conn.cursor()
     c.execute('UPDATE users SET login_attempts = 0, is_locked = 0 WHERE email = ?', (email,))
     conn.commit()
-    conn.close()
 
-def lock_user(email):
-    conn = sqlite3.connect(DATABASE)
+def lock_user(email, login_attempts=None):
+    conn = get_db()
     c = conn.cursor()
-    c.execute('UPDATE users SET is_locked = 1 WHERE email = ?', (email,))
+    if login_attempts is None:
+        c.execute('UPDATE users SET is_locked = 1 WHERE email = ?', (email,))
+    else:
+        c.execute('''UPDATE users SET is_locked = 1, login_attempts = ?, last_login_attempt = CURRENT_TIMESTAMP
+                     WHERE email = ?''', (login_attempts, email))
     conn.commit()
-    conn.close()
+
+def get_login_user(email):
+    """
+    Fetch everything a login attempt needs in one query. Columns 0-9 match the user rows
+    the app stores in the session (role at index 9), followed by login_attempts and is_locked.
+    """
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('''SELECT id, first_name, middle_name, last_name, birthday, age, address, email, password, role,
+                        login_attempts, is_locked
+                 FROM users WHERE email = ?''', (email,))
+    user = c.fetchone()
+    return user
 
 def is_user_locked(email):
-    conn = sqlite3.connect(DATABASE)
+    conn = get_db()
     c = conn.cursor()
     c.execute('SELECT is_locked FROM users WHERE email = ?', (email,))
     result = c.fetchone()
-    conn.close()
     return result[0] if result else False
 
 def get_login_attempts(email):
-    conn = sqlite3.connect(DATABASE)
+    conn = get_db()
     c = conn.cursor()
     c.execute('SELECT login_attempts FROM users WHERE email = ?', (email,))
     result = c.fetchone()
-    conn.close()
     return result[0] if result else 0
 
 def add_product(name, sku, quantity, price):
     """
     Adds a new product to the database. Raises sqlite3.IntegrityError if SKU is not unique.
     """
-    conn = sqlite3.connect(DATABASE)
+    conn = get_db()
     c = conn.cursor()
     try:
         c.execute('''INSERT INTO products (name, sku, quantity, price) VALUES (?, ?, ?, ?)''', (name, sku, int(quantity), float(price)))
@@ -254,86 +866,494 @@ def add_product(name, sku, quantity, price):
     except Exception as e:
         conn.rollback()
         raise
-    finally:
-        conn.close()
+    _cache_product((c.lastrowid, name, sku, int(quantity), float(price)))
+    _catalog.discard('all')
+
+def _cache_product(product):
+    _catalog.set(('id', product[0]), product)
+    _catalog.set(('sku', product[2]), product[0])
+
+def invalidate_product(product_id):
+    """Drop a product from the catalog cache after it was changed outside the write-through paths"""
+    _catalog.discard(('id', product_id))
+
+def clear_catalog_cache():
+    _catalog.clear()
+
+def _product_names_changed():
+    global _product_names_version
+    with _product_names_lock:
+        _product_names_version += 1
+
+def get_product_names_version():
+    return _product_names_version
+
+def sync_caches():
+    """
+    Drop the cached entries that other processes have changed since the last call.
+    Call once per request; when nothing changed it costs one primary key lookup. The
+    log is read without holding the lock, so concurrent requests only queue briefly
+    to apply what they found.
+    """
+    global _last_change_id
+    since = _last_change_id
+    conn = get_db()
+    c = conn.cursor()
+    if since is None:
+        # Nothing has been cached from before this point
+        c.execute('SELECT COALESCE(MAX(id), 0) FROM cache_changes')
+        latest = c.fetchone()[0]
+        with _changes_lock:
+            if _last_change_id is None:
+                _last_change_id = latest
+        return
+    c.execute('SELECT id, entity, key FROM cache_changes WHERE id > ? ORDER BY id', (since,))
+    changes = c.fetchall()
+    if not changes:
+        return
+
+    with _changes_lock:
+        # Another request may have applied some of these while we were reading
+        last = _last_change_id
+        changes = [change for change in changes if change[0] > last]
+        if not changes:
+            return
+        if changes[0][0] != last + 1:
+            # Changes we never saw were already pruned from the log
+            _catalog.clear()
+            _principals.clear()
+            _product_names_changed()
+        else:
+            renamed = False
+            for _, entity, key in changes:
+                if entity in ('catalog', 'product', 'product_name'):
+                    _catalog.discard(('id', key))
+                if entity == 'catalog':
+                    _catalog.discard('all')
+                elif entity == 'product_name':
+                    renamed = True
+                elif entity == 'user':
+                    _principals.discard(key)
+            if renamed:
+                _product_names_changed()
+        _last_change_id = changes[-1][0]
+
+def get_all_products(limit=None):
+    """Live products in id order; the first limit of them straight from the database"""
+    if limit is not None:
+        # A short page is one indexed read, far cheaper than assembling it from the cache
+        conn = get_db()
+        c = conn.cursor()
+        c.execute('SELECT id, name, sku, quantity, price FROM products WHERE is_deleted=0 ORDER BY id LIMIT ?', (limit,))
+        return c.fetchall()
+
+    ids = _catalog.get('all')
+    products = None
+    if ids is not None:
+        products = [_catalog.get(('id', product_id)) for product_id in ids]
+        missing = [product_id for product_id, product in zip(ids, products) if product is None]
+        if missing:
+            # Refresh only the rows that were invalidated or evicted
+            fresh = {}
+            conn = get_db()
+            c = conn.cursor()
+            for start in range(0, len(missing), 500):
+                chunk = missing[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                c.execute(f'SELECT id, name, sku, quantity, price FROM products WHERE id IN ({placeholders}) AND is_deleted=0',
+                          chunk)
+                fresh.update((row[0], row) for row in c.fetchall())
+            if len(fresh) == len(missing):
+                for product in fresh.values():
+                    _cache_product(product)
+                products = [product or fresh[product_id] for product_id, product in zip(ids, products)]
+            else:
+                products = None
+
+    if products is None:
+        conn = get_db()
+        c = conn.cursor()
+        # Without the ORDER BY the planner may read through idx_products_live, i.e. by stock
+        c.execute('SELECT id, name, sku, quantity, price FROM products WHERE is_deleted=0 ORDER BY id')
+        products = c.fetchall()
+        for product in products:
+            _cache_product(product)
+        _catalog.set('all', [product[0] for product in products])
+    return products
 
-def get_all_products():
-    conn = sqlite3.connect(DATABASE)
+def get_low_stock_products(threshold=10):
+    conn = get_db()
     c = conn.cursor()
-    c.execute('SELECT id, name, sku, quantity, price FROM products WHERE is_deleted=0')
+    c.execute('SELECT id, name, sku, quantity, price FROM products WHERE is_deleted=0 AND quantity < ? ORDER BY quantity',
+              (threshold,))
     products = c.fetchall()
-    conn.close()
     return products
 
 def get_product_by_id(product_id):
-    conn = sqlite3.connect(DATABASE)
+    product = _catalog.get(('id', product_id))
+    if product is not None:
+        return product
+    conn = get_db()
     c = conn.cursor()
     c.execute('SELECT id, name, sku, quantity, price FROM products WHERE id=? AND is_deleted=0', (product_id,))
     product = c.fetchone()
-    conn.close()
+    if product:
+        _cache_product(product)
     return product
 
+def get_product_by_sku(sku):
+    product_id = _catalog.get(('sku', sku))
+    if product_id is not None:
+        product = _catalog.get(('id', product_id))
+        # The SKU may have moved to another product since it was cached
+        if product is not None and product[2] == sku:
+            return product
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('SELECT id, name, sku, quantity, price FROM products WHERE sku=? AND is_deleted=0', (sku,))
+    product = c.fetchone()
+    if product:
+        _cache_product(product)
+    return product
+
+def search_products(query, limit=20):
+    """
+    Prefix search over live products' names and SKUs, best matches first. Every word
+    in query must match the start of a word in the name or SKU.
+    """
+    terms = ['"{}"*'.format(term.replace('"', '""')) for term in query.split()]
+    if not terms:
+        return []
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('''SELECT p.id, p.name, p.sku, p.quantity, p.price
+                 FROM products_fts f JOIN products p ON p.id = f.rowid
+                 WHERE products_fts MATCH ? AND p.is_deleted = 0
+                 ORDER BY f.rank LIMIT ?''', (' '.join(terms), limit))
+    products = c.fetchall()
+    return products
+
+def _product_from_record(record):
+    """(name, sku, quantity, price) from an imported record; raises ValueError saying what is wrong"""
+    if record is None:
+        raise ValueError('Could not parse line.')
+    name = str(record.get('name') or '').strip()
+    sku = str(record.get('sku') or '').strip()
+    if not name or not sku:
+        raise ValueError('Name and SKU are required.')
+    try:
+        quantity = int(record.get('quantity'))
+        price = float(record.get('price'))
+    except (TypeError, ValueError):
+        raise ValueError('Invalid quantity or price.')
+    if quantity < 0 or price < 0 or not math.isfinite(price):
+        raise ValueError('Invalid quantity or price.')
+    return name, sku, quantity, price
+
+def _upsert_products(conn, batch):
+    c = conn.cursor()
+    c.execute('BEGIN IMMEDIATE')
+    try:
+        # A SKU that was deleted is brought back with the imported values
+        c.executemany('''INSERT INTO products (name, sku, quantity, price) VALUES (?, ?, ?, ?)
+                         ON CONFLICT (sku) DO UPDATE SET name = excluded.name, quantity = excluded.quantity,
+                                                         price = excluded.price, is_deleted = 0''', batch)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    _catalog.clear()
+    _product_names_changed()
+
+def import_products(records, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Create or update products from (line number, record) pairs, matching on SKU.
+
+    Valid rows are written batch_size at a time, one transaction per batch, so a large
+    file never holds the write lock for long. Returns (rows imported, [(line number, error)]).
+    """
+    conn = get_db()
+    imported = 0
+    errors = []
+    batch = []
+    for line_number, record in records:
+        try:
+            batch.append(_product_from_record(record))
+        except ValueError as e:
+            errors.append((line_number, str(e)))
+            continue
+        if len(batch) >= batch_size:
+            _upsert_products(conn, batch)
+            imported += len(batch)
+            batch = []
+    if batch:
+        _upsert_products(conn, batch)
+        imported += len(batch)
+    return imported, errors
+
+def iter_products(chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield every live product in id order without loading them all at once"""
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('SELECT id, name, sku, quantity, price FROM products WHERE is_deleted=0 ORDER BY id')
+    while True:
+        rows = c.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield from rows
+
 def update_product(product_id, name, sku, quantity, price):
-    conn = sqlite3.connect(DATABASE)
+    conn = get_db()
     c = conn.cursor()
     # Check if the new SKU exists for a different product
     c.execute('SELECT id FROM products WHERE sku=? AND id!=? AND is_deleted=0', (sku, product_id))
     existing = c.fetchone()
     if existing:
-        conn.close()
         raise Exception('SKU already exists for another product.')
     c.execute('''UPDATE products SET name=?, sku=?, quantity=?, price=? WHERE id=?''', (name, sku, quantity, price, product_id))
     conn.commit()
-    conn.close()
+    invalidate_product(product_id)
+    _product_names_changed()
 
 def delete_product(product_id):
-    conn = sqlite3.connect(DATABASE)
+    conn = get_db()
     c = conn.cursor()
     # Soft delete: set is_deleted=1
     c.execute('UPDATE products SET is_deleted=1 WHERE id=?', (product_id,))
     conn.commit()
-    conn.close()
+    invalidate_product(product_id)
+    _catalog.discard('all')
 
 def get_all_staff():
-    conn = sqlite3.connect(DATABASE)
+    conn = get_db()
     c = conn.cursor()
     c.execute('SELECT id, first_name, middle_name, last_name, birthday, age, address, email, role FROM users WHERE role IN ("admin", "seller")')
     staff = c.fetchall()
-    conn.close()
     return staff
 
-def record_sale(total, customer_name=None, customer_email=None, created_by=None):
-    conn = sqlite3.connect(DATABASE)
+def record_sale(total, customer_name=None, customer_email=None, created_by=None, customer_id=None):
+    conn = get_db()
     c = conn.cursor()
-    c.execute('INSERT INTO sales (total, customer_name, customer_email, created_by) VALUES (?, ?, ?, ?)', 
-              (total, customer_name, customer_email, created_by))
+    c.execute('INSERT INTO sales (total, customer_name, customer_email, created_by, customer_id) VALUES (?, ?, ?, ?, ?)', 
+              (total, customer_name, customer_email, created_by, customer_id))
     sale_id = c.lastrowid
+    _rollup_sale(c, sale_id)
     conn.commit()
-    conn.close()
     return sale_id
 
 def add_sale_item(sale_id, product_id, quantity, price):
-    conn = sqlite3.connect(DATABASE)
+    conn = get_db()
     c = conn.cursor()
     c.execute('INSERT INTO sale_items (sale_id, product_id, quantity, price) VALUES (?, ?, ?, ?)', (sale_id, product_id, quantity, price))
+    _rollup_sale_items(c, 'si.id = ?', (c.lastrowid,))
     conn.commit()
-    conn.close()
 
 def update_product_stock(product_id, quantity_sold):
-    conn = sqlite3.connect(DATABASE)
+    conn = get_db()
     c = conn.cursor()
     c.execute('UPDATE products SET quantity = quantity - ? WHERE id = ?', (quantity_sold, product_id))
     conn.commit()
-    conn.close()
+    invalidate_product(product_id)
+
+class CheckoutError(Exception):
+    """Raised when a cart cannot be sold (missing product, bad quantity or not enough stock)"""
+
+def _sell(c, cart, customer):
+    """
+    Sell a cart inside the caller's write transaction. Returns the sale id and the
+    sold products' rows with their new stock, to be cached once the sale commits.
+    """
+    product_ids = list(cart)
+    placeholders = ','.join('?' * len(product_ids))
+    c.execute(f'SELECT id, name, sku, quantity, price FROM products WHERE id IN ({placeholders}) AND is_deleted=0',
+              product_ids)
+    products = {row[0]: row for row in c.fetchall()}
+
+    total = 0
+    items = []
+    for product_id, quantity in cart.items():
+        product = products.get(product_id)
+        if not product:
+            raise CheckoutError('Product not found.')
+        if product[3] < quantity:
+            raise CheckoutError(f'Not enough stock for {product[1]}.')
+        total += product[4] * quantity
+        items.append((product_id, quantity, product[4]))
+
+    c.execute('INSERT INTO sales (total, customer_name, customer_email, created_by, customer_id) VALUES (?, ?, ?, ?, ?)',
+              (total, customer.get('name'), customer.get('email'), customer.get('id'), customer.get('id')))
+    sale_id = c.lastrowid
+    c.executemany('INSERT INTO sale_items (sale_id, product_id, quantity, price) VALUES (?, ?, ?, ?)',
+                  [(sale_id, product_id, quantity, price) for product_id, quantity, price in items])
+    c.executemany('UPDATE products SET quantity = quantity - ? WHERE id = ? AND quantity >= ?',
+                  [(quantity, product_id, quantity) for product_id, quantity, _ in items])
+    if c.rowcount != len(items):
+        raise CheckoutError('Not enough stock to complete the purchase.')
+    _rollup_sale(c, sale_id)
+    _rollup_sale_items(c, 'si.sale_id = ?', (sale_id,))
+    # We hold the write lock, so the stock we read minus what we sold is the current stock
+    sold = [products[product_id][:3] + (products[product_id][3] - quantity,) + products[product_id][4:]
+            for product_id, quantity in cart.items()]
+    return sale_id, sold
+
+def checkout(cart, customer):
+    """
+    Sell a cart in a single transaction and return the new sale id.
+
+    cart maps product_id -> quantity; customer is a dict with 'id', 'name' and 'email'.
+    Prices and stock are read once for the whole cart, and stock is decremented with a
+    guarded UPDATE so two customers can never oversell the same item. While group
+    commit is on the cart is sold by the writer thread and this waits for its sale id.
+    """
+    if not cart:
+        raise CheckoutError('Please select at least one product.')
+    for quantity in cart.values():
+        if quantity <= 0:
+            raise CheckoutError('Invalid quantity.')
+
+    with _writer_lock:
+        if _checkouts is not None:
+            future = Future()
+            _checkouts.put((cart, customer, future))
+        else:
+            future = None
+    if future is not None:
+        try:
+            return future.result(GROUP_COMMIT_TIMEOUT)
+        except TimeoutError:
+            # A cart the writer has not picked up yet can still be withdrawn unsold
+            if future.cancel():
+                raise CheckoutError('The store is too busy to complete the purchase. Please try again.')
+            raise CheckoutError('The purchase is taking too long. Check your transactions before trying again.')
+
+    conn = get_db()
+    c = conn.cursor()
+    # Take the write lock up front so the stock we validate is the stock we sell
+    c.execute('BEGIN IMMEDIATE')
+    try:
+        sale_id, sold = _sell(c, cart, customer)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    for product in sold:
+        _cache_product(product)
+    return sale_id
+
+def start_group_commit(window_ms=GROUP_COMMIT_WINDOW_MS, max_ops=GROUP_COMMIT_MAX_OPS):
+    """Route checkouts through a single writer thread that commits them in groups"""
+    global _checkouts, _writer
+    with _writer_lock:
+        if _writer is not None:
+            return
+        _checkouts = queue.Queue()
+        _writer = threading.Thread(target=_write_groups, args=(_checkouts, window_ms / 1000, max_ops),
+                                   name='group-commit', daemon=True)
+        _writer.start()
+
+def stop_group_commit():
+    """Sell every checkout already queued, then go back to committing each checkout on its own"""
+    global _checkouts, _writer
+    with _writer_lock:
+        if _writer is None:
+            return
+        checkouts, writer = _checkouts, _writer
+        _checkouts = _writer = None
+        # Nothing can be queued behind this, so the writer sells everything before it
+        checkouts.put(None)
+    writer.join()
+
+def get_group_commit_stats():
+    """Snapshot of the group commit writer: batches committed, checkouts sold and queue depth"""
+    with _writer_lock:
+        stats = dict(_group_stats)
+        stats['enabled'] = int(_writer is not None)
+        stats['queue_depth'] = _checkouts.qsize() if _checkouts is not None else 0
+    return stats
+
+def _write_groups(checkouts, window, max_ops):
+    """Writer thread: gather the checkouts queued within window seconds and commit them together"""
+    running = True
+    while running:
+        batch = [checkouts.get()]
+        if batch[0] is None:
+            break
+        deadline = time.perf_counter() + window
+        while len(batch) < max_ops:
+            try:
+                item = checkouts.get(timeout=max(0, deadline - time.perf_counter()))
+            except queue.Empty:
+                break
+            if item is None:
+                running = False
+                break
+            batch.append(item)
+        # Skip carts whose callers gave up waiting
+        batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+        if not batch:
+            continue
+        try:
+            _commit_group(batch)
+        except Exception as e:
+            # Fail this batch's callers rather than leave them waiting, and start the next
+            # batch on a fresh connection in case this one is broken
+            with _writer_lock:
+                _group_stats['failed_batches'] += 1
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            _drop_db()
+    release_db()
+
+def _commit_group(batch):
+    """
+    Sell a batch of (cart, customer, future) in one transaction. Each cart runs in its
+    own savepoint, so one that fails (say, its stock check) is rolled back and reported
+    to its caller alone; the others commit together.
+    """
+    conn = get_db()
+    c = conn.cursor()
+    outcomes = []
+    try:
+        c.execute('BEGIN IMMEDIATE')
+        for cart, customer, future in batch:
+            c.execute('SAVEPOINT checkout')
+            try:
+                outcomes.append((future, _sell(c, cart, customer), None))
+            except Exception as e:
+                c.execute('ROLLBACK TO checkout')
+                outcomes.append((future, None, e))
+            c.execute('RELEASE checkout')
+        conn.commit()
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+
+    sold = [sale for _, sale, _ in outcomes if sale is not None]
+    with _writer_lock:
+        _group_stats['batches'] += 1
+        _group_stats['checkouts'] += len(sold)
+        _group_stats['largest_batch'] = max(_group_stats['largest_batch'], len(batch))
+    # Each cart saw the stock left by the carts before it, so caching in order leaves the latest
+    for sale in sold:
+        for product in sale[1]:
+            _cache_product(product)
+    for future, sale, error in outcomes:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(sale[0])
 
 def get_sales_history(user_role=None, user_id=None):
-    conn = sqlite3.connect(DATABASE)
+    conn = get_db()
     c = conn.cursor()
     
     if user_role == 'customer':
         # Customers can only see their own transactions
         c.execute('''SELECT s.id, s.timestamp, s.customer_name, s.total, s.customer_email 
-                     FROM sales s WHERE s.customer_email = (SELECT email FROM users WHERE id = ?)''', (user_id,))
+                     FROM sales s WHERE s.customer_id = ?
+                     ORDER BY s.timestamp DESC, s.id DESC''', (user_id,))
     else:
         # Admin and sellers can see all transactions
         c.execute('''SELECT s.id, s.timestamp, s.customer_name, s.total, s.customer_email, u.first_name || ' ' || u.last_name as created_by
@@ -342,24 +1362,290 @@ def get_sales_history(user_role=None, user_id=None):
                      ORDER BY s.timestamp DESC''')
     
     sales = c.fetchall()
-    conn.close()
     return sales
 
 def get_sale_details(sale_id):
-    conn = sqlite3.connect(DATABASE)
+    conn = get_db()
     c = conn.cursor()
     c.execute('''SELECT si.quantity, si.price, p.name, p.sku
                  FROM sale_items si
                  JOIN products p ON si.product_id = p.id
                  WHERE si.sale_id = ?''', (sale_id,))
     items = c.fetchall()
-    conn.close()
     return items
 
 def get_sale_by_id(sale_id):
-    conn = sqlite3.connect(DATABASE)
+    conn = get_db()
     c = conn.cursor()
-    c.execute('SELECT * FROM sales WHERE id = ?', (sale_id,))
+    # Explicit columns: legacy databases store the sales columns in a different order
+    c.execute('SELECT id, timestamp, customer_name, customer_email, total, created_by, customer_id FROM sales WHERE id = ?',
+              (sale_id,))
     sale = c.fetchone()
-    conn.close()
-    return sale
\ No newline at end of file
+    return sale
+
+def get_receipt(sale_id):
+    """
+    A sale and its line items from a single query, as (sale, items) shaped like the
+    results of get_sale_by_id and get_sale_details, or (None, []) if there is no such sale.
+    """
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('''SELECT s.id, s.timestamp, s.customer_name, s.customer_email, s.total, s.created_by, s.customer_id,
+                        si.quantity, si.price, p.name, p.sku
+                 FROM sales s
+                 LEFT JOIN sale_items si ON si.sale_id = s.id
+                 LEFT JOIN products p ON p.id = si.product_id
+                 WHERE s.id = ?''', (sale_id,))
+    rows = c.fetchall()
+    if not rows:
+        return None, []
+    # Line items whose product row is gone are left out, as in get_sale_details
+    items = [row[7:] for row in rows if row[9] is not None]
+    return rows[0][:7], items
+
+def customer_owns_sale(sale_id, customer_id):
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('SELECT 1 FROM sales WHERE id = ? AND customer_id = ?', (sale_id, customer_id))
+    return c.fetchone() is not None
+
+def get_dashboard_stats(user_role=None, user_id=None):
+    """
+    Return the dashboard counters as a dict with user_count, product_count, sales_count
+    and total_revenue. Store-wide numbers come from the trigger-maintained dashboard_stats
+    rows; for customers, sales_count and total_revenue cover only their own purchases.
+    """
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('SELECT name, value FROM dashboard_stats')
+    stats = {'user_count': 0, 'product_count': 0, 'sales_count': 0, 'total_revenue': 0}
+    stats.update(dict(c.fetchall()))
+
+    if user_role == 'customer':
+        c.execute('SELECT COUNT(*), COALESCE(SUM(total), 0) FROM sales WHERE customer_id = ?', (user_id,))
+        stats['sales_count'], stats['total_revenue'] = c.fetchone()
+    return stats
+
+def get_recent_sales(limit=10, user_role=None, user_id=None):
+    """Return the newest sales in the same row shape as get_sales_history"""
+    conn = get_db()
+    c = conn.cursor()
+    if user_role == 'customer':
+        c.execute('''SELECT s.id, s.timestamp, s.customer_name, s.total, s.customer_email
+                     FROM sales s WHERE s.customer_id = ?
+                     ORDER BY s.timestamp DESC, s.id DESC LIMIT ?''', (user_id, limit))
+    else:
+        c.execute('''SELECT s.id, s.timestamp, s.customer_name, s.total, s.customer_email, u.first_name || ' ' || u.last_name as created_by
+                     FROM sales s
+                     LEFT JOIN users u ON s.created_by = u.id
+                     ORDER BY s.timestamp DESC, s.id DESC LIMIT ?''', (limit,))
+    sales = c.fetchall()
+    return sales
+
+def _sales_filters(start_date=None, end_date=None, customer_email=None):
+    """SQL conditions on sales s and their parameters for the transaction history filters"""
+    conditions = []
+    params = []
+    if start_date:
+        conditions.append('s.timestamp >= ?')
+        params.append(start_date)
+    if end_date:
+        conditions.append("s.timestamp < date(?, '+1 day')")
+        params.append(end_date)
+    if customer_email:
+        conditions.append('s.customer_email = ?')
+        params.append(customer_email)
+    return conditions, params
+
+def get_sales_summary(start_date=None, end_date=None, customer_email=None):
+    """
+    sales_count and total_revenue of the sales matching the transaction history filters,
+    in the shape of get_dashboard_stats. Unfiltered, they come from the dashboard counters.
+    """
+    conditions, params = _sales_filters(start_date, end_date, customer_email)
+    if not conditions:
+        stats = get_dashboard_stats()
+        return {'sales_count': stats['sales_count'], 'total_revenue': stats['total_revenue']}
+    conn = get_db()
+    c = conn.cursor()
+    c.execute(f"SELECT COUNT(*), COALESCE(SUM(s.total), 0) FROM sales s WHERE {' AND '.join(conditions)}", params)
+    sales_count, total_revenue = c.fetchone()
+    return {'sales_count': sales_count, 'total_revenue': total_revenue}
+
+def get_sales_page(cursor=None, limit=50, start_date=None, end_date=None, customer_email=None):
+    """
+    Return one page of sales (newest first) and the cursor for the next page.
+
+    Pages are keyed on (timestamp, id) rather than OFFSET, so every page costs the same
+    no matter how deep into the history it is. cursor is the value returned for the
+    previous page, or None for the first page; the returned cursor is None on the last page.
+    start_date and end_date are inclusive 'YYYY-MM-DD' strings.
+    """
+    conditions, params = _sales_filters(start_date, end_date, customer_email)
+    if cursor:
+        timestamp, sale_id = decode_sales_cursor(cursor)
+        conditions.append('(s.timestamp, s.id) < (?, ?)')
+        params.extend([timestamp, sale_id])
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+    conn = get_db()
+    c = conn.cursor()
+    c.execute(f'''SELECT s.id, s.timestamp, s.customer_name, s.total, s.customer_email, u.first_name || ' ' || u.last_name as created_by
+                  FROM sales s
+                  LEFT JOIN users u ON s.created_by = u.id
+                  {where}
+                  ORDER BY s.timestamp DESC, s.id DESC LIMIT ?''', params + [limit + 1])
+    sales = c.fetchall()
+
+    next_cursor = None
+    if len(sales) > limit:
+        sales = sales[:limit]
+        next_cursor = encode_sales_cursor(sales[-1][1], sales[-1][0])
+    return sales, next_cursor
+
+def iter_sales(start_date=None, end_date=None, customer_email=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield (id, timestamp, customer_name, customer_email, total, created_by) for every
+    sale matching the filters, oldest first, fetching chunk_size rows at a time.
+    """
+    conditions, params = _sales_filters(start_date, end_date, customer_email)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    conn = get_db()
+    c = conn.cursor()
+    c.execute(f'''SELECT s.id, s.timestamp, s.customer_name, s.customer_email, s.total, u.first_name || ' ' || u.last_name
+                  FROM sales s
+                  LEFT JOIN users u ON s.created_by = u.id
+                  {where}
+                  ORDER BY s.timestamp, s.id''', params)
+    while True:
+        rows = c.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield from rows
+
+def iter_sale_items(start_date=None, end_date=None, customer_email=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield (sale_id, timestamp, product_id, sku, product_name, quantity, price, line_total)
+    for the line items of every sale matching the filters, in sale order.
+    """
+    conditions, params = _sales_filters(start_date, end_date, customer_email)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    conn = get_db()
+    c = conn.cursor()
+    c.execute(f'''SELECT si.sale_id, s.timestamp, si.product_id, p.sku, p.name, si.quantity, si.price, si.quantity * si.price
+                  FROM sales s
+                  JOIN sale_items si ON si.sale_id = s.id
+                  LEFT JOIN products p ON p.id = si.product_id
+                  {where}
+                  ORDER BY s.timestamp, s.id''', params)
+    while True:
+        rows = c.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield from rows
+
+def encode_sales_cursor(timestamp, sale_id):
+    return f'{timestamp}|{sale_id}'
+
+def decode_sales_cursor(cursor):
+    """Split a cursor from encode_sales_cursor; raises ValueError if it is malformed"""
+    timestamp, sale_id = cursor.rsplit('|', 1)
+    return timestamp, int(sale_id)
+
+# Report rollups. Sales are bucketed by their UTC timestamp into sales_daily,
+# sales_hourly, product_sales_daily and seller_sales_daily. Every write path that
+# records a sale updates them in the same transaction; rebuild_sales_rollups()
+# recomputes them from scratch.
+
+def _rollup_sale(c, sale_id):
+    """Add one sale's count and revenue to the rollups; call inside the transaction that inserted it"""
+    for table, key, bucket in (('sales_daily', 'day', "date(timestamp)"),
+                               ('sales_hourly', 'hour', "strftime('%Y-%m-%d %H', timestamp)")):
+        c.execute(f'''INSERT INTO {table} ({key}, sales_count, revenue)
+                      SELECT {bucket}, 1, total FROM sales WHERE id = ?
+                      ON CONFLICT ({key}) DO UPDATE SET sales_count = sales_count + 1, revenue = revenue + excluded.revenue''',
+                  (sale_id,))
+    c.execute('''INSERT INTO seller_sales_daily (day, created_by, sales_count, revenue)
+                 SELECT date(timestamp), created_by, 1, total FROM sales WHERE id = ? AND created_by IS NOT NULL
+                 ON CONFLICT (day, created_by) DO UPDATE SET sales_count = sales_count + 1,
+                                                            revenue = revenue + excluded.revenue''', (sale_id,))
+
+def _rollup_sale_items(c, where, params):
+    """Add the sale_items matching where (aliased si) to the unit and per-product rollups"""
+    c.execute(f'''INSERT INTO product_sales_daily (day, product_id, units, revenue)
+                  SELECT date(s.timestamp), si.product_id, SUM(si.quantity), SUM(si.quantity * si.price)
+                  FROM sale_items si JOIN sales s ON s.id = si.sale_id
+                  WHERE {where} GROUP BY 1, 2
+                  ON CONFLICT (day, product_id) DO UPDATE SET units = units + excluded.units,
+                                                             revenue = revenue + excluded.revenue''', params)
+    for table, key, bucket in (('sales_daily', 'day', "date(s.timestamp)"),
+                               ('sales_hourly', 'hour', "strftime('%Y-%m-%d %H', s.timestamp)")):
+        c.execute(f'''INSERT INTO {table} ({key}, units)
+                      SELECT {bucket}, SUM(si.quantity)
+                      FROM sale_items si JOIN sales s ON s.id = si.sale_id
+                      WHERE {where} GROUP BY 1
+                      ON CONFLICT ({key}) DO UPDATE SET units = units + excluded.units''', params)
+
+def _rebuild_sales_rollups(c):
+    for table in ('sales_daily', 'sales_hourly', 'product_sales_daily', 'seller_sales_daily'):
+        c.execute(f'DELETE FROM {table}')
+    c.execute('''INSERT INTO sales_daily (day, sales_count, revenue)
+                 SELECT date(timestamp), COUNT(*), SUM(total) FROM sales GROUP BY 1''')
+    c.execute('''INSERT INTO sales_hourly (hour, sales_count, revenue)
+                 SELECT strftime('%Y-%m-%d %H', timestamp), COUNT(*), SUM(total) FROM sales GROUP BY 1''')
+    c.execute('''INSERT INTO seller_sales_daily (day, created_by, sales_count, revenue)
+                 SELECT date(timestamp), created_by, COUNT(*), SUM(total) FROM sales
+                 WHERE created_by IS NOT NULL GROUP BY 1, 2''')
+    _rollup_sale_items(c, '1', ())
+
+def rebuild_sales_rollups():
+    """Recompute every rollup table from sales and sale_items in one transaction (backfill/repair)"""
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('BEGIN IMMEDIATE')
+    try:
+        _rebuild_sales_rollups(c)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+def get_daily_sales(start_date, end_date):
+    """(day, sales_count, revenue, units) for each day with sales in the inclusive date range"""
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('''SELECT day, sales_count, revenue, units FROM sales_daily
+                 WHERE day BETWEEN ? AND ? ORDER BY day''', (start_date, end_date))
+    return c.fetchall()
+
+def get_hourly_sales(day):
+    """(hour, sales_count, revenue, units) for each hour of day that had sales"""
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('''SELECT hour, sales_count, revenue, units FROM sales_hourly
+                 WHERE hour BETWEEN ? AND ? ORDER BY hour''', (f'{day} 00', f'{day} 23'))
+    return c.fetchall()
+
+def get_top_products(start_date, end_date, limit=20):
+    """(product_id, name, sku, units, revenue) for the best sellers by revenue in the date range"""
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('''SELECT r.product_id, p.name, p.sku, SUM(r.units) AS units, SUM(r.revenue) AS revenue
+                 FROM product_sales_daily r
+                 LEFT JOIN products p ON p.id = r.product_id
+                 WHERE r.day BETWEEN ? AND ?
+                 GROUP BY r.product_id
+                 ORDER BY revenue DESC LIMIT ?''', (start_date, end_date, limit))
+    return c.fetchall()
+
+def get_seller_sales(start_date, end_date):
+    """(created_by, name, sales_count, revenue) per seller in the date range"""
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('''SELECT r.created_by, u.first_name || ' ' || u.last_name, SUM(r.sales_count), SUM(r.revenue) AS revenue
+                 FROM seller_sales_daily r
+                 LEFT JOIN users u ON u.id = r.created_by
+                 WHERE r.day BETWEEN ? AND ?
+                 GROUP BY r.created_by
+                 ORDER BY revenue DESC''', (start_date, end_date))
+    return c.fetchall()